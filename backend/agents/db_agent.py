@@ -1,13 +1,23 @@
 from typing import List, Dict, Optional
-from neo4j import GraphDatabase, Driver, Session
+from neo4j import AsyncGraphDatabase, AsyncDriver, AsyncManagedTransaction
 from datetime import datetime
 import logging
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, field
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Result columns in Paper field order, so rows can be splatted into Paper(*row)
+_PAPER_FIELDS = ("id", "title", "authors", "summary", "year", "url", "keywords")
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+def _escape_lucene(text: str) -> str:
+    """Escape Lucene query syntax so topics are matched as plain terms"""
+    return _LUCENE_SPECIAL.sub(r"\\\1", text)
+
+@dataclass(slots=True)
 class Paper:
     id: str
     title: str
@@ -15,42 +25,64 @@ class Paper:
     summary: str
     year: int
     url: str
-    keywords: List[str] = None
+    keywords: Optional[List[str]] = field(default=None)
 
 class DBAgent:
     def __init__(self, uri: str, user: str, password: str):
-        """Initialize database connection"""
+        """Create the async database driver; call connect() before use"""
+        self.driver: AsyncDriver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+
+    async def connect(self):
+        """Verify the connection and ensure indexes exist"""
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
-            self.verify_connectivity()
+            await self.verify_connectivity()
+            await self._ensure_indexes()
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
 
-    def verify_connectivity(self):
+    async def verify_connectivity(self):
         """Test database connection"""
         try:
-            self.driver.verify_connectivity()
+            await self.driver.verify_connectivity()
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Connection verification failed: {e}")
             raise
 
-    def close(self):
+    async def _ensure_indexes(self):
+        """Create the constraints backing the MERGE keys and the year and text indexes"""
+        queries = [
+            # Same statements as Neo4jHandler's schema, so whichever runs first wins
+            # and the other is a no-op; the constraints bring their own indexes
+            "CREATE CONSTRAINT paper_id IF NOT EXISTS FOR (p:Paper) REQUIRE p.id IS UNIQUE",
+            "CREATE CONSTRAINT author_name IF NOT EXISTS FOR (a:Author) REQUIRE a.name IS UNIQUE",
+            "CREATE CONSTRAINT keyword_name IF NOT EXISTS FOR (k:Keyword) REQUIRE k.name IS UNIQUE",
+            "CREATE INDEX paper_year IF NOT EXISTS FOR (p:Paper) ON (p.year)",
+            "CREATE FULLTEXT INDEX paper_fts IF NOT EXISTS "
+            "FOR (p:Paper) ON EACH [p.title, p.summary]"
+        ]
+        async with self.driver.session() as session:
+            for query in queries:
+                result = await session.run(query)
+                await result.consume()
+        logger.info("Database indexes ensured")
+
+    async def close(self):
         """Close database connection"""
         if self.driver:
-            self.driver.close()
+            await self.driver.close()
 
-    def store_paper(self, paper: Paper) -> bool:
+    async def store_paper(self, paper: Paper) -> bool:
         """Store single paper with relationships"""
         try:
-            with self.driver.session() as session:
-                return session.execute_write(self._create_paper_tx, paper)
+            async with self.driver.session() as session:
+                return await session.execute_write(self._create_paper_tx, paper)
         except Exception as e:
             logger.error(f"Error storing paper {paper.id}: {e}")
             return False
 
-    def _create_paper_tx(self, tx: Session, paper: Paper) -> bool:
+    async def _create_paper_tx(self, tx: AsyncManagedTransaction, paper: Paper) -> bool:
         """Transaction to create paper and relationships"""
         query = """
         MERGE (p:Paper {id: $id})
@@ -69,7 +101,7 @@ class DBAgent:
         MERGE (p)-[:HAS_KEYWORD]->(k)
         RETURN p
         """
-        result = tx.run(
+        result = await tx.run(
             query,
             id=paper.id,
             title=paper.title,
@@ -79,9 +111,56 @@ class DBAgent:
             authors=paper.authors,
             keywords=paper.keywords or []
         )
-        return result.single() is not None
+        return await result.single() is not None
 
-    def query_papers(
+    async def store_papers(self, papers: List[Paper]) -> bool:
+        """Store multiple papers with relationships in a single transaction"""
+        if not papers:
+            return True
+        try:
+            async with self.driver.session() as session:
+                return await session.execute_write(self._create_papers_bulk_tx, papers)
+        except Exception as e:
+            logger.error(f"Error storing {len(papers)} papers: {e}")
+            return False
+
+    async def _create_papers_bulk_tx(
+        self,
+        tx: AsyncManagedTransaction,
+        papers: List[Paper]
+    ) -> bool:
+        """Transaction to create papers and relationships via UNWIND"""
+        query = """
+        UNWIND $papers AS row
+        MERGE (p:Paper {id: row.id})
+        SET p += row.props,
+            p.updated_at = datetime()
+        FOREACH (author IN row.authors |
+            MERGE (a:Author {name: author})
+            MERGE (a)-[:AUTHORED]->(p)
+        )
+        FOREACH (keyword IN row.keywords |
+            MERGE (k:Keyword {name: keyword})
+            MERGE (p)-[:HAS_KEYWORD]->(k)
+        )
+        RETURN count(p) as stored
+        """
+        rows = [{
+            "id": paper.id,
+            "props": {
+                "title": paper.title,
+                "summary": paper.summary,
+                "year": paper.year,
+                "url": paper.url
+            },
+            "authors": paper.authors,
+            "keywords": paper.keywords or []
+        } for paper in papers]
+        result = await tx.run(query, papers=rows)
+        record = await result.single()
+        return record["stored"] == len(papers)
+
+    async def query_papers(
         self,
         topic: str,
         start_year: int,
@@ -89,8 +168,8 @@ class DBAgent:
     ) -> List[Paper]:
         """Query papers with pagination and sorting"""
         try:
-            with self.driver.session() as session:
-                return session.execute_read(
+            async with self.driver.session() as session:
+                return await session.execute_read(
                     self._query_papers_tx,
                     topic,
                     start_year,
@@ -100,49 +179,52 @@ class DBAgent:
             logger.error(f"Error querying papers: {e}")
             return []
 
-    def _query_papers_tx(
+    async def _query_papers_tx(
         self,
-        tx: Session,
+        tx: AsyncManagedTransaction,
         topic: str,
         start_year: int,
         limit: int
     ) -> List[Paper]:
         """Transaction to query papers"""
         query = """
-        MATCH (p:Paper)
+        CALL db.index.fulltext.queryNodes('paper_fts', $topic) YIELD node AS p, score
         WHERE p.year >= $start_year
-        AND (p.title CONTAINS $topic OR p.summary CONTAINS $topic)
-        MATCH (a:Author)-[:AUTHORED]->(p)
-        MATCH (p)-[:HAS_KEYWORD]->(k)
+        WITH p, score
+        ORDER BY score DESC, p.year DESC
+        LIMIT $limit
+        CALL {
+            WITH p
+            MATCH (a:Author)-[:AUTHORED]->(p)
+            RETURN collect(DISTINCT a.name) as authors
+        }
+        CALL {
+            WITH p
+            MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+            RETURN collect(DISTINCT k.name) as keywords
+        }
         RETURN p.id as id,
                p.title as title,
                p.summary as summary,
                p.year as year,
                p.url as url,
-               collect(DISTINCT a.name) as authors,
-               collect(DISTINCT k.name) as keywords
-        ORDER BY p.year DESC
-        LIMIT $limit
+               authors,
+               keywords
         """
-        results = tx.run(query, topic=topic, start_year=start_year, limit=limit)
-        papers = []
-        for record in results:
-            papers.append(Paper(
-                id=record["id"],
-                title=record["title"],
-                summary=record["summary"],
-                year=record["year"],
-                url=record["url"],
-                authors=record["authors"],
-                keywords=record["keywords"]
-            ))
-        return papers
-
-    def get_related_papers(self, paper_id: str, limit: int = 5) -> List[Paper]:
+        results = await tx.run(
+            query,
+            topic=_escape_lucene(topic),
+            start_year=start_year,
+            limit=limit
+        )
+        rows = await results.values(*_PAPER_FIELDS)
+        return [Paper(*row) for row in rows]
+
+    async def get_related_papers(self, paper_id: str, limit: int = 5) -> List[Paper]:
         """Find papers with similar keywords or authors"""
         try:
-            with self.driver.session() as session:
-                return session.execute_read(
+            async with self.driver.session() as session:
+                return await session.execute_read(
                     self._get_related_papers_tx,
                     paper_id,
                     limit
@@ -151,9 +233,9 @@ class DBAgent:
             logger.error(f"Error finding related papers: {e}")
             return []
 
-    def _get_related_papers_tx(
+    async def _get_related_papers_tx(
         self,
-        tx: Session,
+        tx: AsyncManagedTransaction,
         paper_id: str,
         limit: int
     ) -> List[Paper]:
@@ -165,23 +247,24 @@ class DBAgent:
         WITH related, count(k) as common_keywords
         ORDER BY common_keywords DESC
         LIMIT $limit
-        MATCH (a:Author)-[:AUTHORED]->(related)
-        MATCH (related)-[:HAS_KEYWORD]->(k)
+        CALL {
+            WITH related
+            MATCH (a:Author)-[:AUTHORED]->(related)
+            RETURN collect(DISTINCT a.name) as authors
+        }
+        CALL {
+            WITH related
+            MATCH (related)-[:HAS_KEYWORD]->(k:Keyword)
+            RETURN collect(DISTINCT k.name) as keywords
+        }
         RETURN related.id as id,
                related.title as title,
                related.summary as summary,
                related.year as year,
                related.url as url,
-               collect(DISTINCT a.name) as authors,
-               collect(DISTINCT k.name) as keywords
+               authors,
+               keywords
         """
-        results = tx.run(query, paper_id=paper_id, limit=limit)
-        return [Paper(
-            id=record["id"],
-            title=record["title"],
-            summary=record["summary"],
-            year=record["year"],
-            url=record["url"],
-            authors=record["authors"],
-            keywords=record["keywords"]
-        ) for record in results]
\ No newline at end of file
+        results = await tx.run(query, paper_id=paper_id, limit=limit)
+        rows = await results.values(*_PAPER_FIELDS)
+        return [Paper(*row) for row in rows]
\ No newline at end of file
@@ -1,31 +1,95 @@
 # FILE: backend/agents/future_works_agent.py
 
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator, Mapping, Union
+from functools import partial
+from transformers import TextIteratorStreamer
 from models.schemas import Paper
+from services.llm_service import LLMService, stream_generation
+from services.completion_client import CompletionClient
 import asyncio
+import threading
 import torch
+from contextlib import nullcontext
 
 logger = logging.getLogger(__name__)
 
+# Full papers, or the id/title/year/authors/abstract projection from get_paper_summary_by_ids
+PaperLike = Union[Paper, Mapping[str, Any]]
+
 class FutureWorksAgent:
-    def __init__(self, model, tokenizer):
+    def __init__(
+        self,
+        model=None,
+        tokenizer=None,
+        llm_service: Optional[LLMService] = None,
+        completion_client: Optional[CompletionClient] = None
+    ):
         """
         Initialize the FutureWorksAgent with a transformers LLM model and tokenizer.
         
         Args:
             model: The pre-trained language model instance.
             tokenizer: The tokenizer associated with the model.
+            llm_service (Optional[LLMService]): Shared generation engine; when given,
+                model and tokenizer are not needed and generation is delegated to it.
+            completion_client (Optional[CompletionClient]): OpenAI-compatible server to
+                generate on instead of an in-process model.
         """
-        self.model = model.to("cuda" if torch.cuda.is_available() else "cpu")
+        self.llm_service = llm_service
+        self.completion_client = completion_client
+        if llm_service or completion_client:
+            self.model = None
+            self.tokenizer = None
+            return
+
+        # Quantized models are already placed and cannot be moved
+        if getattr(model, "is_quantized", False):
+            self.model = model
+        else:
+            self.model = model.to("cuda" if torch.cuda.is_available() else "cpu")
+        self.model.eval()
         self.tokenizer = tokenizer
 
-    async def create_improvement_plan(self, papers: List[Paper]) -> Dict[str, Any]:
+        # OPT-style tokenizers may lack a pad token; warmup passes one to generate()
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        # Static KV cache keeps shapes fixed so reduce-overhead can use CUDA graphs
+        # The static cache lives on the model, so overlapping generate() calls
+        # (buffered and streamed) must take turns or they corrupt each other's output
+        self._generate_lock = nullcontext()
+        if getattr(self.model, "_supports_static_cache", False):
+            self.model.generation_config.cache_implementation = "static"
+            self._generate_lock = threading.Lock()
+        # Compile forward only: generate() has data-dependent control flow
+        self.model.forward = torch.compile(
+            self.model.forward, mode="reduce-overhead", fullgraph=False
+        )
+
+        self._warmup()
+
+    @torch.inference_mode()
+    def _warmup(self):
+        """
+        Run a tiny generation so the first request skips kernel setup and compilation.
+        """
+        dummy = self.tokenizer("warmup", return_tensors="pt").to(self.model.device)
+        self.model.generate(
+            **dummy,
+            max_new_tokens=4,
+            pad_token_id=self.tokenizer.pad_token_id
+        )
+        if self.model.device.type == "cuda":
+            torch.cuda.synchronize()
+        logger.info("Future works model warmed up")
+
+    async def create_improvement_plan(self, papers: List[PaperLike]) -> Dict[str, Any]:
         """
         Generate an improvement plan based on the selected papers.
         
         Args:
-            papers (List[Paper]): A list of Paper objects containing details of each paper.
+            papers (List[PaperLike]): Paper objects or projected paper summaries.
         
         Returns:
             Dict[str, Any]: A dictionary containing the improvement plan, findings, and metrics.
@@ -50,29 +114,103 @@ class FutureWorksAgent:
             logger.error(f"Review generation error: {e}")
             raise
 
-    def create_prompt(self, papers: List[Paper]) -> str:
+    async def generate_future_work_ideas(self, papers: List[PaperLike]) -> Dict[str, Any]:
+        """
+        Generate future research directions based on the selected papers.
+
+        Args:
+            papers (List[PaperLike]): Paper objects or projected paper summaries.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the future work ideas and the paper count.
+        """
+        try:
+            prompt = self.create_prompt(papers, future_work=True)
+            ideas = await self.llm_generate_async(prompt)
+
+            return {
+                "future_work": ideas,
+                "paper_count": len(papers)
+            }
+
+        except Exception as e:
+            logger.error(f"Future work generation error: {e}")
+            raise
+
+    async def stream_improvement_plan(self, papers: List[Paper]) -> AsyncIterator[str]:
+        """
+        Stream an improvement plan for the selected papers as it is generated.
+
+        Args:
+            papers (List[Paper]): A list of Paper objects containing details of each paper.
+
+        Yields:
+            str: Newly generated text, without the prompt.
+        """
+        prompt = self.create_prompt(papers)
+
+        if self.llm_service:
+            async for text in self.llm_service.stream_text(
+                prompt,
+                max_tokens=512,
+                temperature=0.7,
+                top_p=0.9
+            ):
+                yield text
+            return
+
+        if self.completion_client:
+            async for text in self.completion_client.stream(
+                prompt,
+                max_tokens=512,
+                temperature=0.7,
+                top_p=0.9
+            ):
+                yield text
+            return
+
+        # skip_prompt replaces _strip_prompt, since only new tokens are streamed
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        async for text in stream_generation(partial(self.llm_generate, prompt, streamer), streamer):
+            yield text
+
+    def create_prompt(self, papers: List[PaperLike], future_work: bool = False) -> str:
         """
         Create a well-structured prompt for the LLM.
         
         Args:
-            papers (List[Paper]): A list of Paper objects.
+            papers (List[PaperLike]): Paper objects or projected paper summaries.
+            future_work (bool): Ask for future research directions instead of an improvement plan.
         
         Returns:
             str: The formatted prompt string.
         """
-        papers_text = "\n\n".join([
-            f"Title: {p.title}\nYear: {p.year}\nAbstract: {p.abstract}"
-            for p in papers
-        ])
+        papers_text = "\n\n".join([self._format_paper(p) for p in papers])
+        if future_work:
+            task = (
+                "Suggest concrete future research directions that build on these papers "
+                "and address their open problems.\n\n"
+            )
+        else:
+            task = (
+                "Generate an improvement plan that includes novel contributions and suggestions for new research directions. "
+                "Structure it as a cohesive plan.\n\n"
+            )
         prompt = (
             "Using the key findings from the following papers:\n\n"
             f"{papers_text}\n\n"
-            "Generate an improvement plan that includes novel contributions and suggestions for new research directions. "
-            "Structure it as a cohesive plan.\n\n"
+            f"{task}"
             "Summary of the work presented:\n"
         )
         return prompt
 
+    @staticmethod
+    def _format_paper(paper: PaperLike) -> str:
+        """Format one paper for the prompt, whether a Paper or a projected summary"""
+        if isinstance(paper, Mapping):
+            return f"Title: {paper['title']}\nYear: {paper['year']}\nAbstract: {paper['abstract']}"
+        return f"Title: {paper.title}\nYear: {paper.year}\nAbstract: {paper.abstract}"
+
     async def llm_generate_async(self, prompt: str) -> str:
         """
         Asynchronously generate text using the transformers LLM.
@@ -85,6 +223,24 @@ class FutureWorksAgent:
         """
         loop = asyncio.get_event_loop()
         try:
+            if self.llm_service:
+                output = await self.llm_service.complete(
+                    prompt,
+                    max_tokens=512,
+                    temperature=0.7,
+                    top_p=0.9
+                )
+                return output.outputs[0].text.strip()
+
+            if self.completion_client:
+                improvement_plan = await self.completion_client.complete(
+                    prompt,
+                    max_tokens=512,
+                    temperature=0.7,
+                    top_p=0.9
+                )
+                return improvement_plan.strip()
+
             # Run the synchronous generate method in a thread pool to prevent blocking
             improvement_plan = await loop.run_in_executor(None, self.llm_generate, prompt)
             return improvement_plan
@@ -92,12 +248,14 @@ class FutureWorksAgent:
             logger.error(f"LLM generation error: {e}")
             return "Failed to generate improvement plan."
 
-    def llm_generate(self, prompt: str) -> str:
+    @torch.inference_mode()
+    def llm_generate(self, prompt: str, streamer: Optional[TextIteratorStreamer] = None) -> str:
         """
         Synchronously generate text using the transformers LLM.
         
         Args:
             prompt (str): The input prompt for the LLM.
+            streamer (Optional[TextIteratorStreamer]): Receives tokens as they are generated.
         
         Returns:
             str: The generated improvement plan.
@@ -107,30 +265,36 @@ class FutureWorksAgent:
             input_ids = self.tokenizer.encode(prompt, return_tensors="pt").to(self.model.device)
 
             # Generate output tokens
-            output_ids = self.model.generate(
-                input_ids,
-                max_length=1024,  # Reduced max_length for faster generation
-                num_return_sequences=1,
-                no_repeat_ngram_size=3,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                eos_token_id=self.tokenizer.eos_token_id
-            )
+            with self._generate_lock:
+                output_ids = self.model.generate(
+                    input_ids,
+                    max_length=1024,  # Reduced max_length for faster generation
+                    num_return_sequences=1,
+                    no_repeat_ngram_size=3,
+                    temperature=0.7,
+                    top_p=0.9,
+                    do_sample=True,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    streamer=streamer
+                )
 
             # Decode the generated tokens
             improvement_plan = self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
 
-            # Post-process to remove the prompt from the output if it gets included
-            summary_start = improvement_plan.find("Summary of the work presented:")
-            if summary_start != -1:
-                improvement_plan = improvement_plan[summary_start + len("Summary of the work presented:"):].strip()
-
-            return improvement_plan
+            return self._strip_prompt(improvement_plan)
         except Exception as e:
             logger.error(f"Synchronous LLM generation error: {e}")
             return "Failed to generate improvement plan."
 
+    @staticmethod
+    def _strip_prompt(text: str) -> str:
+        """Remove the prompt from the generated output if it gets included"""
+        marker = "Summary of the work presented:"
+        summary_start = text.find(marker)
+        if summary_start != -1:
+            text = text[summary_start + len(marker):].strip()
+        return text
+
     def analyze_improvement_plan(self, plan: str) -> Tuple[List[str], Dict[str, Any]]:
         """
         Analyze the improvement plan to extract findings and metrics.
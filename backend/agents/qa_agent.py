@@ -1,61 +1,165 @@
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
-from typing import List, Dict, Optional, Union, Any
+from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+from typing import List, Dict, Optional, Union, Any, Tuple, AsyncIterator
 import torch
+import ahocorasick
 import logging
 import asyncio
+import bisect
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from models.schemas import Paper
-from services.text_processing import TextProcessingService
-from services.image_processing import ImageProcessingService
+from services.text_processing import text_processor
+from services.image_processing import image_processor
+from services.llm_service import LLMService, stream_generation
 
 logger = logging.getLogger(__name__)
 
+# Allow TF32 tensor cores for any remaining float32 matmuls
+torch.set_float32_matmul_precision('high')
+
+# GPT-2 context window and the share of it reserved for the answer
+MAX_POSITIONS = 1024
+MAX_NEW_TOKENS = 150
+
 class QAAgent:
-    def __init__(self):
-        self.qa_pipeline = pipeline("question-answering")
-        self.text_processor = TextProcessingService()
-        self.image_processor = ImageProcessingService()
-        self.llm = AutoModelForCausalLM.from_pretrained("gpt2")
-        self.tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    def __init__(
+        self,
+        onnx_model_dir: Optional[str] = None,
+        max_inflight: int = 2,
+        assistant_model: Optional[str] = None,
+        llm_service: Optional[LLMService] = None
+    ):
+        # Bounded pool for torch-bound calls so they never block the event loop
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="qa")
+        # Shared instance, so chunk embeddings cached at search time are reused
+        self.text_processor = text_processor
+        # Shared instance, so only one OCR reader is loaded
+        self.image_processor = image_processor
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.llm.to(self.device)
+        # With a shared engine the prompt must be tokenized for the engine's model
+        self.llm_service = llm_service
+        self.tokenizer = AutoTokenizer.from_pretrained(llm_service.model if llm_service else "gpt2")
+        # Fixed prompt template pieces are tokenized once
+        self._context_prefix_ids = self.tokenizer("Context: ").input_ids
+        self._question_prefix_ids = self.tokenizer("\n\nQuestion: ").input_ids
+        self._answer_prefix_ids = self.tokenizer("\nAnswer:").input_ids
+        # Replaced with a lock when generate() shares one static KV cache
+        self._generate_lock = nullcontext()
+        # Speculative decoding drafter; shares GPT-2's vocabulary and tokenizer
+        self.assistant = None
+        self.llm = None
+        if llm_service:
+            logger.info("QA generation delegated to the shared LLM service")
+        elif onnx_model_dir:
+            self.llm = self._load_onnx_model(onnx_model_dir)
+        else:
+            if assistant_model:
+                self.assistant = self._load_assistant_model(assistant_model)
+            self.llm = self._load_torch_model()
 
-    async def _generate_answer(self, question: str, context: str) -> Dict:
-        try:
-            # Get initial answer from QA pipeline (optional)
-            qa_result = await asyncio.to_thread(
-                self.qa_pipeline,
-                question=question,
-                context=context[:500]  # Truncate context if needed
-            )
+        if self.llm is not None:
+            self._warmup()
 
-            # Simplify the prompt
-            prompt = f"Question: {question}\nAnswer:"
+    @torch.inference_mode()
+    def _warmup(self):
+        """Run a tiny generation so the first request skips kernel setup and compilation"""
+        dummy = self.tokenizer("warmup", return_tensors="pt").to(self.device)
+        self.llm.generate(
+            **dummy,
+            max_new_tokens=4,
+            pad_token_id=self.tokenizer.eos_token_id,
+            assistant_model=self.assistant
+        )
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        logger.info("QA model warmed up")
 
-            inputs = self.tokenizer.encode(prompt, return_tensors='pt').to(self.device)
+    def _load_torch_model(self):
+        """Load GPT-2 as an eager PyTorch model with compiled forward"""
+        # Half precision only pays off on GPU; CPU kernels stay in float32
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        llm = AutoModelForCausalLM.from_pretrained("gpt2", torch_dtype=dtype)
+        llm.to(self.device)
+        llm.eval()
 
-            max_new_tokens = 150  # Limit the length of the generated answer
+        # Static KV cache keeps shapes fixed so reduce-overhead can use CUDA graphs;
+        # assisted generation manages its own dynamic cache, so only without a drafter
+        if self.assistant is None and getattr(llm, "_supports_static_cache", False):
+            llm.generation_config.cache_implementation = "static"
+            # The cache lives on the model, so overlapping generate() calls would
+            # overwrite each other's keys and values
+            self._generate_lock = threading.Lock()
+        # Compile forward only: generate() has data-dependent control flow.
+        # Assisted decoding changes the input length every step, which would keep
+        # re-recording CUDA graphs, so it gets the default mode instead
+        mode = "default" if self.assistant is not None else "reduce-overhead"
+        llm.forward = torch.compile(llm.forward, mode=mode, fullgraph=False)
+        return llm
 
-            outputs = self.llm.generate(
-                inputs,
-                max_new_tokens=max_new_tokens,
-                do_sample=True,
-                temperature=0.7,
-                top_p=0.9,
-                no_repeat_ngram_size=3,
-                eos_token_id=self.tokenizer.eos_token_id
-            )
+    def _load_assistant_model(self, model_name: str):
+        """Load the small drafter model used for speculative decoding"""
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        assistant = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype)
+        assistant.to(self.device)
+        assistant.eval()
+        return assistant
 
-            # Decode and extract the answer
-            generated_text = self.tokenizer.decode(
-                outputs[0],
-                skip_special_tokens=True
-            )
-            # Remove the prompt from the generated text
-            answer = generated_text[len(prompt):].strip()
+    def _load_onnx_model(self, model_dir: str):
+        """Load an ONNX export of GPT-2 (see export_onnx.py) on ONNX Runtime"""
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        if self.device == "cuda":
+            # TensorRT builds fused FP16 engines on first use and caches them
+            provider = "TensorrtExecutionProvider"
+            provider_options = {
+                "trt_fp16_enable": True,
+                "trt_engine_cache_enable": True,
+                "trt_engine_cache_path": f"{model_dir}/trt_cache"
+            }
+        else:
+            provider = "CPUExecutionProvider"
+            provider_options = None
+
+        llm = ORTModelForCausalLM.from_pretrained(
+            model_dir,
+            provider=provider,
+            provider_options=provider_options
+        )
+        logger.info(f"Loaded ONNX QA model from {model_dir} on {provider}")
+        return llm
+
+    async def _generate_answer(self, question: str, context: str) -> Dict:
+        try:
+            prompt_ids = self._build_prompt_ids(question, context, MAX_NEW_TOKENS)
+
+            if self.llm_service:
+                answer, confidence = await self._generate_with_service(prompt_ids)
+            else:
+                input_ids = torch.tensor([prompt_ids], device=self.device)
+                inputs = {
+                    "input_ids": input_ids,
+                    "attention_mask": torch.ones_like(input_ids)
+                }
+                output_ids, confidence = await asyncio.get_running_loop().run_in_executor(
+                    self._pool,
+                    self._run_generate,
+                    inputs,
+                    MAX_NEW_TOKENS
+                )
+
+                # Only the newly generated tokens are decoded, so no prompt to strip
+                answer = self.tokenizer.decode(
+                    output_ids,
+                    skip_special_tokens=True
+                ).strip()
 
             return {
                 "text": answer,
-                "confidence": qa_result.get("score", 0.0)
+                "confidence": confidence
             }
 
         except Exception as e:
@@ -64,6 +168,112 @@ class QAAgent:
                 "text": "Failed to generate answer",
                 "confidence": 0.0
             }
+
+    def _build_prompt_ids(self, question: str, context: str, max_new_tokens: int) -> List[int]:
+        """Tokenize the prompt once, truncating the context to fit the context window"""
+        question_ids = (
+            self._question_prefix_ids
+            + self.tokenizer(question).input_ids
+            + self._answer_prefix_ids
+        )
+        budget = MAX_POSITIONS - max_new_tokens - len(question_ids) - len(self._context_prefix_ids)
+
+        context_ids = []
+        if context and budget > 0:
+            context_ids = self.tokenizer(
+                context,
+                truncation=True,
+                max_length=budget
+            ).input_ids
+
+        return self._context_prefix_ids + context_ids + question_ids
+
+    async def _generate_with_service(self, prompt_ids: List[int]) -> Tuple[str, float]:
+        """Generate on the shared LLM engine, returning answer text and confidence"""
+        output = await self.llm_service.complete(
+            {"prompt_token_ids": prompt_ids},
+            max_tokens=MAX_NEW_TOKENS,
+            temperature=0.7,
+            top_p=0.9,
+            logprobs=1
+        )
+        completion = output.outputs[0]
+        return completion.text.strip(), self._service_confidence(completion)
+
+    @staticmethod
+    def _service_confidence(completion: Any) -> float:
+        """Same measure as the local path: mean probability of the top token per step"""
+        step_probs = [
+            max(math.exp(logprob.logprob) for logprob in step.values())
+            for step in completion.logprobs or []
+        ]
+        return sum(step_probs) / len(step_probs) if step_probs else 0.0
+
+    async def _stream_answer_text(self, question: str, context: str) -> AsyncIterator[Dict]:
+        """Stream {"text"} events as the answer is generated, then one {"confidence"} event"""
+        prompt_ids = self._build_prompt_ids(question, context, MAX_NEW_TOKENS)
+
+        if self.llm_service:
+            sent = 0
+            completion = None
+            async for output in self.llm_service.generate(
+                {"prompt_token_ids": prompt_ids},
+                max_tokens=MAX_NEW_TOKENS,
+                temperature=0.7,
+                top_p=0.9,
+                logprobs=1
+            ):
+                completion = output.outputs[0]
+                if len(completion.text) > sent:
+                    yield {"text": completion.text[sent:]}
+                    sent = len(completion.text)
+            yield {"confidence": self._service_confidence(completion) if completion else 0.0}
+            return
+
+        input_ids = torch.tensor([prompt_ids], device=self.device)
+        inputs = {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids)
+        }
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        # The streamer only carries text, so keep generate()'s scores for the confidence
+        result: List[Tuple[torch.Tensor, float]] = []
+
+        def run():
+            result.append(self._run_generate(inputs, MAX_NEW_TOKENS, streamer))
+
+        async for text in stream_generation(run, streamer, self._pool):
+            yield {"text": text}
+        yield {"confidence": result[0][1] if result else 0.0}
+
+    @torch.inference_mode()
+    def _run_generate(
+        self,
+        inputs: Dict[str, torch.Tensor],
+        max_new_tokens: int,
+        streamer: Optional[TextIteratorStreamer] = None
+    ) -> Tuple[torch.Tensor, float]:
+        """Run LLM generation on a pool thread, returning new tokens and confidence"""
+        with self._generate_lock:
+            outputs = self.llm.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=True,
+                temperature=0.7,
+                top_p=0.9,
+                no_repeat_ngram_size=3,
+                eos_token_id=self.tokenizer.eos_token_id,
+                pad_token_id=self.tokenizer.eos_token_id,
+                assistant_model=self.assistant,
+                streamer=streamer,
+                return_dict_in_generate=True,
+                output_scores=True
+            )
+        # Confidence is the mean probability of the most likely token at each step
+        probs = torch.stack(outputs.scores, dim=1).float().softmax(-1)
+        confidence = probs.max(-1).values.mean().item()
+        prompt_length = inputs["input_ids"].shape[1]
+        return outputs.sequences[0, prompt_length:], confidence
     
 
     async def _process_paper(self, paper: Paper, question: str) -> Optional[Dict]:
@@ -72,7 +282,14 @@ class QAAgent:
             return None
             
         content = paper.full_text if paper.full_text else paper.abstract
-        relevant_text = self.text_processor.extract_relevant_text(content, question)
+        # Chunk embeddings come from the cache or the stored bytes; only the query is encoded
+        relevant_text = await asyncio.to_thread(
+            self.text_processor.extract_relevant_text,
+            content,
+            question,
+            paper_id=paper.id,
+            stored_embeddings=paper.chunk_embeddings
+        )
         
         # Handle image questions
         if paper.images and self._is_image_question(question):
@@ -80,61 +297,93 @@ class QAAgent:
             if image_texts:
                 relevant_text += "\n" + image_texts
             
+        # Exact contexts are attached by _attach_exact_contexts
         return {
             "paper_id": paper.id,
             "title": paper.title,
             "text": relevant_text,
-            "year": paper.year,
-            "context": self._find_exact_context(content, relevant_text)
+            "year": paper.year
         }
 
-    def _find_exact_context(self, full_text: str, relevant_text: str) -> List[Dict]:
-        """Find exact locations of relevant text in paper"""
-        contexts = []
-        paragraphs = full_text.split('\n\n')
-        
-        for i, para in enumerate(paragraphs):
-            if relevant_text in para:
-                contexts.append({
+    @staticmethod
+    def _build_automaton(snippets: List[str]) -> Optional[ahocorasick.Automaton]:
+        """Build one Aho-Corasick automaton matching all snippets"""
+        positions: Dict[str, List[int]] = {}
+        for i, snippet in enumerate(snippets):
+            if snippet:
+                positions.setdefault(snippet, []).append(i)
+        if not positions:
+            return None
+
+        automaton = ahocorasick.Automaton()
+        for snippet, indices in positions.items():
+            automaton.add_word(snippet, (snippet, indices))
+        automaton.make_automaton()
+        return automaton
+
+    @staticmethod
+    def _match_paragraphs(
+        automaton: Optional[ahocorasick.Automaton],
+        full_text: str,
+        count: int
+    ) -> List[List[Dict]]:
+        """Find the paragraphs containing each snippet in a single pass over the text"""
+        matches: List[List[Dict]] = [[] for _ in range(count)]
+        if automaton is None or not full_text:
+            return matches
+
+        # Paragraph i spans (boundaries[i-1] + 2, boundaries[i])
+        boundaries = [m.start() for m in re.finditer("\n\n", full_text)]
+        seen = set()
+
+        for last, (snippet, indices) in automaton.iter(full_text):
+            idx = last - len(snippet) + 1
+            i = bisect.bisect_right(boundaries, idx)
+            start = boundaries[i - 1] + 2 if i else 0
+            end = boundaries[i] if i < len(boundaries) else len(full_text)
+
+            # Hits spanning a paragraph break do not belong to any paragraph
+            if idx < start or last >= end or (snippet, i) in seen:
+                continue
+            seen.add((snippet, i))
+
+            for index in indices:
+                matches[index].append({
                     "section": f"Paragraph {i+1}",
-                    "text": para,
-                    "excerpt": relevant_text
+                    "text": full_text[start:end],
+                    "excerpt": snippet
                 })
-        return contexts
+        return matches
+
+    def _attach_exact_contexts(self, papers: List[Paper], contexts: List[Dict]) -> None:
+        """Locate every context snippet across all papers with one shared automaton"""
+        automaton = self._build_automaton([ctx["text"] for ctx in contexts])
+        for ctx in contexts:
+            ctx["context"] = []
+
+        for paper in papers:
+            content = paper.full_text or paper.abstract
+            found = self._match_paragraphs(automaton, content, len(contexts))
+            for ctx, paragraphs in zip(contexts, found):
+                for paragraph in paragraphs:
+                    paragraph["paper_id"] = paper.id
+                    ctx["context"].append(paragraph)
 
     async def _process_image_question(self, paper: Paper, question: str) -> str:
-        """Enhanced image processing with chart/graph detection"""
-        image_texts = []
-        for img in paper.images or []:
-            # Process image based on type
-            if "chart" in img.get("type", "").lower():
-                img_text = await self.image_processor.analyze_chart(img["data"])
-            elif "graph" in img.get("type", "").lower():
-                img_text = await self.image_processor.analyze_graph(img["data"])
-            else:
-                img_text = await self.image_processor.analyze_image(img["data"])
-                
-            image_texts.append(f"Figure {img['index']} ({img.get('type', 'image')}) "
-                             f"on page {img['page']}: {img_text}")
-        return "\n".join(image_texts)
+        """OCR the paper's figures in one batch and describe each by page"""
+        # Images loaded from the database carry only page/index/type, not bytes
+        images = [img for img in paper.images or [] if img.get("data")]
+        if not images:
+            return ""
 
-    def _format_response(self, answer: Dict, contexts: List[Dict], combined_context: str) -> Dict:
-        """Enhanced response formatting with exact citations"""
-        return {
-            "text": answer["text"],
-            "confidence": answer.get("confidence", 0.0),
-            "sources": [
-                {
-                    "paper_id": ctx["paper_id"],
-                    "title": ctx["title"],
-                    "year": ctx["year"],
-                    "excerpt": ctx["text"],
-                    "context": ctx.get("context", [])
-                }
-                for ctx in contexts
-            ],
-            "context_used": combined_context
-        }
+        img_texts = await asyncio.to_thread(
+            self.image_processor.extract_texts_from_bytes, [img["data"] for img in images]
+        )
+        return "\n".join(
+            f"Figure {img['index']} ({img.get('type', 'image')}) on page {img['page']}: {img_text}"
+            for img, img_text in zip(images, img_texts)
+            if img_text
+        )
 
     async def answer_question(self, papers: List[Paper], question: str) -> Dict:
         """Handle both single and multi-paper questions"""
@@ -142,59 +391,81 @@ class QAAgent:
             raise ValueError("Papers list and question cannot be empty")
             
         try:
-            # Process single paper in detail
-            if len(papers) == 1:
-                context = await self._process_paper(papers[0], question)
-                if not context:
-                    raise ValueError("No relevant content found in paper")
-                    
-                answer = await self._generate_answer(question, context["text"])
-                return self._format_response(answer, [context], context["text"])
-            
-            # Process multiple papers
-            all_contexts = await self._gather_contexts(papers, question)
-            sorted_contexts = self.text_processor.rank_contexts(all_contexts, question)
-            combined_context = self._combine_contexts(sorted_contexts[:3])
-            
+            contexts, combined_context = await self._prepare_contexts(papers, question)
             answer = await self._generate_answer(question, combined_context)
-            return self._format_response(answer, sorted_contexts[:3], combined_context)
+            return self._format_response(answer, contexts, combined_context)
             
         except Exception as e:
             logger.error(f"Error in answer_question: {e}")
             raise
 
+    async def stream_answer(self, papers: List[Paper], question: str) -> AsyncIterator[Dict]:
+        """Stream answer text events, followed by one event with confidence and sources"""
+        if not papers or not question:
+            raise ValueError("Papers list and question cannot be empty")
+
+        try:
+            contexts, combined_context = await self._prepare_contexts(papers, question)
+            answer_text = []
+            confidence = 0.0
+            async for event in self._stream_answer_text(question, combined_context):
+                if "text" in event:
+                    answer_text.append(event["text"])
+                    yield event
+                else:
+                    confidence = event["confidence"]
+
+            response = self._format_response(
+                {"text": "".join(answer_text).strip(), "confidence": confidence},
+                contexts,
+                combined_context
+            )
+            yield {
+                "confidence": response["confidence"],
+                "sources": response["sources"],
+                "context_used": response["context_used"]
+            }
+
+        except Exception as e:
+            logger.error(f"Error in stream_answer: {e}")
+            raise
+
+    async def _prepare_contexts(self, papers: List[Paper], question: str) -> Tuple[List[Dict], str]:
+        """Select the contexts to answer from and the combined prompt context"""
+        # Process single paper in detail
+        if len(papers) == 1:
+            context = await self._process_paper(papers[0], question)
+            if not context:
+                raise ValueError("No relevant content found in paper")
+                
+            self._attach_exact_contexts(papers, [context])
+            return [context], context["text"]
+        
+        # Process multiple papers
+        all_contexts = await self._gather_contexts(papers, question)
+        top_contexts = self.text_processor.rank_contexts(all_contexts, question, top_k=3)
+        self._attach_exact_contexts(papers, top_contexts)
+        return top_contexts, self._combine_contexts(top_contexts)
+
     async def _gather_contexts(self, papers: List[Paper], question: str) -> List[Dict]:
         """Gather relevant contexts from papers"""
+        papers = [paper for paper in papers if paper.full_text or paper.abstract]
+        # One batched encode for all papers' chunks instead of one per paper
+        texts = await asyncio.to_thread(
+            self.text_processor.extract_relevant_text_multi, papers, question
+        )
+
         contexts = []
-        for paper in papers:
-            try:
-                context = await self._process_paper(paper, question)
-                if context:
-                    contexts.append(context)
-            except Exception as e:
-                logger.warning(f"Error processing paper {paper.id}: {e}")
-                continue
+        for paper, text in zip(papers, texts):
+            if text:
+                contexts.append({
+                    "paper_id": paper.id,
+                    "title": paper.title,
+                    "text": text,
+                    "year": paper.year
+                })
         return contexts
 
-    async def _process_paper(self, paper: Paper, question: str) -> Optional[Dict]:
-        """Process individual paper for relevant context"""
-        content = paper.abstract
-        if not content:
-            return None
-            
-        # relevant_text = self.text_processor.extract_relevant_text(content, question)
-        
-        # if paper.images and self._is_image_question(question):
-        #     image_text = await self._process_image_question(paper, question)
-        #     relevant_text += "\n" + image_text
-            
-        return {
-            "paper_id": paper.id,
-            "title": paper.title,
-            "text": content,
-            "year": paper.year
-        }
-
     @staticmethod
     def _is_image_question(question: str) -> bool:
         """Check if question is related to images"""
@@ -218,14 +489,15 @@ class QAAgent:
                     "paper_id": ctx["paper_id"],
                     "title": ctx["title"],
                     "year": ctx["year"],
-                    "excerpt": ctx["text"][:200] + "..."
+                    "excerpt": ctx["text"][:200] + "...",
+                    "context": ctx.get("context", [])
                 }
                 for ctx in contexts
             ],
             "context_used": combined_context[:1000]
         }
 
-    @torch.no_grad()
+    @torch.inference_mode()
     def _generate_llm_response(self, prompt: str) -> Dict:
         """Generate LLM response with proper resource handling"""
         try:
@@ -236,15 +508,16 @@ class QAAgent:
                 max_length=1024
             ).to(self.device)
             
-            outputs = self.llm.generate(
-                **inputs,
-                max_length=2048,  # Increased output length
-                num_return_sequences=1,
-                no_repeat_ngram_size=3,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True
-            )
+            with self._generate_lock:
+                outputs = self.llm.generate(
+                    **inputs,
+                    max_length=2048,  # Increased output length
+                    num_return_sequences=1,
+                    no_repeat_ngram_size=3,
+                    temperature=0.7,
+                    top_p=0.9,
+                    do_sample=True
+                )
             
             response = self.llm_tokenizer.decode(
                 outputs[0],
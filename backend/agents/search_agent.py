@@ -5,75 +5,92 @@ from typing import List, Optional, Dict, Any
 from models.schemas import Paper
 from database.neo4j_handler import Neo4jHandler
 from services.pdf_processing import PDFProcessingService
+from services.text_processing import text_processor
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 
 class SearchAgent:
-    def __init__(self, db_handler: Neo4jHandler):
+    def __init__(self, db_handler: Neo4jHandler, pdf_cache_dir: str = ".cache/pdfs"):
         self.db_handler = db_handler
-        self.pdf_processor = PDFProcessingService()
+        # Caches extractions, so repeat searches skip download and parsing
+        self.pdf_processor = PDFProcessingService(cache_dir=pdf_cache_dir)
+        # Shared with QAAgent so chunk embeddings computed here are reused there
+        self.text_processor = text_processor
+        # One client keeps the HTTP session alive across searches; a 100-result
+        # page covers any max_results we use in a single request
+        self._arxiv_client = arxiv.Client(page_size=100, num_retries=3)
         
-    async def _store_paper_safe(self, paper: Paper) -> None:
-        """Safely store paper with PDF content"""
+    async def _load_pdf_safe(self, paper: Paper) -> Paper:
+        """Safely return a copy of paper with its PDF content attached"""
         try:
-            # Extract PDF content using process_pdf_url
+            # Extract PDF content, reusing earlier extractions of the same paper
             pdf_content: Optional[Dict[str, Any]] = await self.pdf_processor.process_pdf_url(paper.url)
+            update: Dict[str, Any] = {}
             
             if pdf_content:
-                paper.full_text = pdf_content["text"]
-                paper.images = pdf_content["images"]
-            
-            # Store paper in database
-            success = await asyncio.to_thread(
-                self.db_handler.store_paper,
-                paper
-            )
-            
-            if not success:
-                logger.warning(f"Failed to store paper {paper.id}")
+                update["full_text"] = pdf_content["text"]
+                update["images"] = pdf_content["images"]
+                update["has_full_text"] = bool(pdf_content["text"])
+                update["has_images"] = bool(pdf_content["images"])
+
+            # Encode chunks once here so questions about the paper only encode the query
+            chunks = self.text_processor.split_chunks(update.get("full_text") or paper.abstract)
+            if chunks:
+                embeddings = await asyncio.to_thread(
+                    self.text_processor.encode_chunks_cached, paper.id, chunks
+                )
+                update["chunk_embeddings"] = self.text_processor.serialize_embeddings(embeddings)
+
+            return paper.model_copy(update=update)
                 
         except Exception as e:
-            logger.error(f"Error storing paper with PDF: {e}")
+            logger.error(f"Error loading PDF content: {e}")
             raise
 
     async def search_papers(self, topic: str, max_results: int = 5) -> List[Paper]:
         """Search for papers on given topic"""
         try:
-            client = arxiv.Client()
             search = arxiv.Search(
                 query=topic,
                 max_results=max_results,
                 sort_by=arxiv.SortCriterion.SubmittedDate
             )
 
-            results = list(client.results(search))[:max_results]
-            papers: List[Paper] = []
+            results = list(self._arxiv_client.results(search))[:max_results]
+            papers: List[Paper] = [
+                Paper(
+                    id=result.entry_id.split("/")[-1],
+                    title=result.title,
+                    authors=[str(author) for author in result.authors],
+                    abstract=result.summary,
+                    year=result.published.year,
+                    url=result.pdf_url,
+                    has_full_text=False,  # Will be updated after PDF processing
+                    has_images=False      # Will be updated after PDF processing
+                )
+                for result in results
+            ]
+
+            # Process PDFs concurrently
+            outcomes = await asyncio.gather(
+                *[self._load_pdf_safe(paper) for paper in papers],
+                return_exceptions=True
+            )
 
-            for result in results:
-                try:
-                    # Create paper with required fields
-                    paper = Paper(
-                        id=result.entry_id.split("/")[-1],
-                        title=result.title,
-                        authors=[str(author) for author in result.authors],
-                        abstract=result.summary,
-                        year=result.published.year,
-                        url=result.pdf_url,
-                        has_full_text=False,  # Will be updated after PDF processing
-                        has_images=False      # Will be updated after PDF processing
-                    )
-                    
-                    # Store and process PDF
-                    await self._store_paper_safe(paper)
-                    papers.append(paper)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing paper {result.entry_id}: {e}")
+            processed: List[Paper] = []
+            for paper, outcome in zip(papers, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error(f"Error processing paper {paper.id}: {outcome}")
                     continue
+                processed.append(outcome)
+
+            # Store all papers in one transaction
+            if not await self.db_handler.store_papers(processed):
+                logger.warning(f"Failed to store {len(processed)} papers")
 
-            return papers
+            return processed
 
         except Exception as e:
             logger.error(f"Search error: {e}")
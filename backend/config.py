@@ -1,4 +1,6 @@
 # config.py
+from functools import lru_cache
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -10,7 +12,32 @@ class Settings(BaseSettings):
     NEO4J_HTTPS_PORT: int = 7473
     MAX_RETRIES: int = 5
     RETRY_DELAY: float = 1.0
+    # Directory produced by export_onnx.py; unset keeps the PyTorch QA model
+    QA_ONNX_MODEL_DIR: Optional[str] = None
+    # Concurrent QA model calls; size to what the GPU can overlap
+    QA_INFLIGHT: int = 2
+    # Opt-in drafter for speculative decoding in QAAgent, e.g. "distilgpt2";
+    # it disables the static cache and CUDA graphs, so leave unset unless it measures faster
+    QA_ASSISTANT_MODEL: Optional[str] = None
+    PDF_CACHE_DIR: str = ".cache/pdfs"
+    # Redis read-through cache for paper lookups; unset disables it
+    REDIS_URL: Optional[str] = None
+    PAPER_CACHE_TTL: int = 3600
+    # Model for the shared vLLM engine used by all agents; unset keeps
+    # in-process transformers models
+    LLM_SERVICE_MODEL: Optional[str] = None
+    # OpenAI-compatible server for future works generation, e.g. a vLLM sidecar:
+    #   python -m vllm.entrypoints.openai.api_server --model facebook/opt-1.3b --dtype float16
+    # Set to the server's API root, e.g. http://localhost:8001/v1 ("/v1" is added if missing).
+    # When set, OPT is not loaded in-process
+    FUTURE_WORKS_API_URL: Optional[str] = None
+    FUTURE_WORKS_API_MODEL: str = "facebook/opt-1.3b"
+    # Weight quantization for the in-process OPT model: "int8", "int4" or unset
+    LLM_QUANTIZATION: Optional[str] = None
 
-    model_config = SettingsConfigDict(env_file=".env")
+    model_config = SettingsConfigDict(env_file=".env", frozen=True)
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings once, on first use rather than at import"""
+    return Settings()
\ No newline at end of file
@@ -1,172 +1,413 @@
-from neo4j import GraphDatabase
-from neo4j import Session, Transaction
+from neo4j import AsyncGraphDatabase
+from neo4j import AsyncSession, AsyncManagedTransaction
+import asyncio
 import logging
+import msgpack
 from models.schemas import Paper
-from contextlib import contextmanager
-from typing import Optional, Dict, Any, Generator
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncGenerator, List
 
 logger = logging.getLogger(__name__)
 
+# Cypher is kept in module-level constants and only ever parameterized with $params:
+# Neo4j caches plans by query text, so each string must stay byte-identical across calls
+
+_CYPHER_SCHEMA = [
+    "CREATE CONSTRAINT paper_id IF NOT EXISTS FOR (p:Paper) REQUIRE p.id IS UNIQUE",
+    "CREATE CONSTRAINT author_name IF NOT EXISTS FOR (a:Author) REQUIRE a.name IS UNIQUE",
+    "CREATE CONSTRAINT keyword_name IF NOT EXISTS FOR (k:Keyword) REQUIRE k.name IS UNIQUE"
+]
+
+_CYPHER_STORE_PAPER = """
+    MERGE (p:Paper {id: $id})
+    SET p.title = $title,
+        p.abstract = $abstract,
+        p.year = $year,
+        p.url = $url,
+        p.full_text = $full_text,
+        p.chunk_embeddings = $chunk_embeddings,
+        p.updated_at = datetime()
+    
+    WITH p
+    UNWIND $authors as author
+    MERGE (a:Author {name: author})
+    MERGE (a)-[:AUTHORED]->(p)
+    
+    WITH p
+    UNWIND $keywords as keyword
+    MERGE (k:Keyword {name: keyword})
+    MERGE (p)-[:HAS_KEYWORD]->(k)
+    
+    WITH p
+    UNWIND $images as image
+    MERGE (i:Image {
+        page: image.page,
+        index: image.index,
+        type: image.type
+    })
+    MERGE (p)-[:HAS_IMAGE]->(i)
+    
+    RETURN p
+"""
+
+# FOREACH keeps the row alive when a paper has no authors/keywords/images
+_CYPHER_STORE_PAPERS = """
+    UNWIND $papers AS row
+    MERGE (p:Paper {id: row.id})
+    SET p += row.props,
+        p.updated_at = datetime()
+    FOREACH (author IN row.authors |
+        MERGE (a:Author {name: author})
+        MERGE (a)-[:AUTHORED]->(p)
+    )
+    FOREACH (keyword IN row.keywords |
+        MERGE (k:Keyword {name: keyword})
+        MERGE (p)-[:HAS_KEYWORD]->(k)
+    )
+    FOREACH (image IN row.images |
+        MERGE (i:Image {
+            page: image.page,
+            index: image.index,
+            type: image.type
+        })
+        MERGE (p)-[:HAS_IMAGE]->(i)
+    )
+    RETURN count(p) as stored
+"""
+
+_CYPHER_GET_PAPER_BY_ID = """
+    MATCH (p:Paper {id: $id})
+    OPTIONAL MATCH (p)<-[:AUTHORED]-(a:Author)
+    OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+    OPTIONAL MATCH (p)-[:HAS_IMAGE]->(i:Image)
+    RETURN p,
+           collect(DISTINCT a.name) as authors,
+           collect(DISTINCT k.name) as keywords,
+           collect(DISTINCT i) as images
+"""
+
+# Collect after each OPTIONAL MATCH so rows don't multiply across them
+_CYPHER_GET_PAPERS_BY_IDS = """
+    MATCH (p:Paper)
+    WHERE p.id IN $ids
+    OPTIONAL MATCH (p)<-[:AUTHORED]-(a:Author)
+    WITH p, collect(DISTINCT a.name) as authors
+    OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+    WITH p, authors, collect(DISTINCT k.name) as keywords
+    OPTIONAL MATCH (p)-[:HAS_IMAGE]->(i:Image)
+    RETURN p.id as id,
+           p,
+           authors,
+           keywords,
+           collect(DISTINCT i) as images
+"""
+
+# Projection for list views and prompts: no full_text, embeddings or images
+_CYPHER_GET_PAPER_SUMMARIES_BY_IDS = """
+    MATCH (p:Paper)
+    WHERE p.id IN $ids
+    OPTIONAL MATCH (p)<-[:AUTHORED]-(a:Author)
+    WITH p, collect(DISTINCT a.name) as authors
+    RETURN p.id as id,
+           p.title as title,
+           p.year as year,
+           authors,
+           p.abstract as abstract
+"""
+
 class Neo4jHandler:
-    def __init__(self, uri: str, user: str, password: str):
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        max_pool_size: int = 100,
+        redis_url: Optional[str] = None,
+        cache_ttl: int = 3600
+    ):
+        """Create the async database driver; call connect() before use"""
         self.uri = uri
         self.user = user
         self.password = password
+        self.max_pool_size = max_pool_size
         self.driver = None
-        self._connect()
+        self._create_driver()
 
-    def _connect(self):
+        # Shutdown waits for sessions in flight and refuses new ones
+        self._close_lock = asyncio.Lock()
+        self._closing = False
+        self._in_flight = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+        # Optional read-through cache for paper lookups
+        self.cache = None
+        self.cache_ttl = cache_ttl
+        if redis_url:
+            # Imported here so Redis stays an optional dependency
+            import redis.asyncio as redis
+            self.cache = redis.from_url(redis_url)
+
+    def _create_driver(self):
+        """Initialize the pooled driver"""
+        # One pooled driver serves every session; bound how long a request
+        # may wait for a free connection under load
+        self.driver = AsyncGraphDatabase.driver(
+            self.uri,
+            auth=(self.user, self.password),
+            max_connection_pool_size=self.max_pool_size,
+            max_connection_lifetime=3600,
+            connection_acquisition_timeout=60
+        )
+
+    async def connect(self):
         """Initialize database connection"""
         try:
-            self.driver = GraphDatabase.driver(
-                self.uri,
-                auth=(self.user, self.password)
-            )
-            self.driver.verify_connectivity()
+            await self.driver.verify_connectivity()
             logger.info("Connected to Neo4j database")
+            await self.ensure_schema()
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             raise
 
+    async def ensure_schema(self):
+        """Create uniqueness constraints backing the MERGE keys"""
+        async with self.get_session() as session:
+            for query in _CYPHER_SCHEMA:
+                result = await session.run(query)
+                await result.consume()
+        logger.info("Database constraints ensured")
+
     async def store_paper(self, paper: Paper) -> bool:
         """
         Store paper and its relationships in Neo4j asynchronously
         """
         try:
-            # Since Neo4j Python driver doesn't support native async,
-            # we'll use run_in_executor to prevent blocking
-            return await self._run_in_executor(self._sync_store_paper, paper)
+            async with self.get_session() as session:
+                return await session.execute_write(self._create_paper_tx, paper)
         except Exception as e:
             logger.error(f"Error storing paper {paper.id}: {e}")
             return False
+        finally:
+            await self._cache_invalidate([paper.id])
 
-    async def _run_in_executor(self, func, *args):
-        """Helper method to run synchronous code in executor"""
-        import asyncio
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, func, *args)
-
-    def _sync_store_paper(self, paper: Paper) -> bool:
-        """Synchronous method for storing the paper"""
-        with self.get_session() as session:
-            return session.execute_write(self._create_paper_tx, paper)
-
-    def _create_paper_tx(self, tx: Transaction, paper: Paper) -> bool:
+    async def _create_paper_tx(self, tx: AsyncManagedTransaction, paper: Paper) -> bool:
         """Transaction to create paper with relationships"""
-        query = """
-        MERGE (p:Paper {id: $id})
-        SET p.title = $title,
-            p.abstract = $abstract,
-            p.year = $year,
-            p.url = $url,
-            p.full_text = $full_text,
-            p.updated_at = datetime()
-        
-        WITH p
-        UNWIND $authors as author
-        MERGE (a:Author {name: author})
-        MERGE (a)-[:AUTHORED]->(p)
-        
-        WITH p
-        UNWIND $keywords as keyword
-        MERGE (k:Keyword {name: keyword})
-        MERGE (p)-[:HAS_KEYWORD]->(k)
-        
-        WITH p
-        UNWIND $images as image
-        MERGE (i:Image {
-            page: image.page,
-            index: image.index,
-            type: image.type
-        })
-        MERGE (p)-[:HAS_IMAGE]->(i)
-        
-        RETURN p
-        """
         try:
-            result = tx.run(
-                query,
+            result = await tx.run(
+                _CYPHER_STORE_PAPER,
                 id=paper.id,
                 title=paper.title,
                 abstract=paper.abstract,
                 year=paper.year,
                 url=paper.url,
                 full_text=getattr(paper, 'full_text', None),
+                chunk_embeddings=getattr(paper, 'chunk_embeddings', None),
                 authors=paper.authors,
                 keywords=getattr(paper, 'keywords', []),
                 images=getattr(paper, 'images', [])
             )
-            return result.single() is not None
+            return await result.single() is not None
         except Exception as e:
             logger.error(f"Transaction error for paper {paper.id}: {e}")
             return False
 
-    async def get_paper_by_id(self, paper_id):
-        query = """
-        MATCH (p:Paper {id: $id})
-        OPTIONAL MATCH (p)-[:HAS_IMAGE]->(i:Image)
-        RETURN p, collect(i) as images
-        """
-        async with self.driver.session() as session:
-            try:
-                result = await session.execute_run(query, id=paper_id)
+    async def store_papers(self, papers: List[Paper]) -> bool:
+        """Store multiple papers with relationships in a single transaction"""
+        if not papers:
+            return True
+        try:
+            async with self.get_session() as session:
+                return await session.execute_write(self._create_papers_bulk_tx, papers)
+        except Exception as e:
+            logger.error(f"Error storing {len(papers)} papers: {e}")
+            return False
+        finally:
+            await self._cache_invalidate([paper.id for paper in papers])
+
+    async def _create_papers_bulk_tx(
+        self,
+        tx: AsyncManagedTransaction,
+        papers: List[Paper]
+    ) -> bool:
+        """Transaction to create papers and relationships via UNWIND"""
+        rows = [{
+            "id": paper.id,
+            "props": {
+                "title": paper.title,
+                "abstract": paper.abstract,
+                "year": paper.year,
+                "url": paper.url,
+                "full_text": paper.full_text,
+                "chunk_embeddings": paper.chunk_embeddings
+            },
+            "authors": paper.authors,
+            "keywords": getattr(paper, 'keywords', None) or [],
+            "images": [
+                {"page": img["page"], "index": img["index"], "type": img["type"]}
+                for img in paper.images or []
+            ]
+        } for paper in papers]
+        result = await tx.run(_CYPHER_STORE_PAPERS, papers=rows)
+        record = await result.single()
+        return record["stored"] == len(papers)
+
+    async def get_paper_by_id(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a paper by ID"""
+        cached = await self._cache_get([paper_id])
+        if paper_id in cached:
+            return cached[paper_id]
+        try:
+            async with self.get_session() as session:
+                result = await session.run(_CYPHER_GET_PAPER_BY_ID, id=paper_id)
                 record = await result.single()
                 if record:
-                    paper = record['p']
-                    images = record['images']
-                    return {
-                        "id": paper.get("id"),
-                        "title": paper.get("title"),
-                        "images": images
-                    }
-                return None
+                    paper = self._record_to_paper(record)
+                    await self._cache_set({paper_id: paper})
+                    return paper
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching paper by id {paper_id}: {e}")
+            return None
+
+    async def get_papers_by_ids(self, paper_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several papers in one query, keyed by paper ID"""
+        if not paper_ids:
+            return {}
+        papers = await self._cache_get(paper_ids)
+        missing = [pid for pid in paper_ids if pid not in papers]
+        if missing:
+            try:
+                async with self.get_session() as session:
+                    fetched = await session.execute_read(self._get_papers_by_ids_tx, missing)
             except Exception as e:
-                logger.error(f"Error fetching paper by id {paper_id}: {e}")
-                return None
-
-    def _sync_get_paper_by_id(self, paper_id: str) -> Optional[Dict[str, Any]]:
-        """Synchronous method for retrieving paper by ID"""
-        query = """
-        MATCH (p:Paper {id: $id})
-        OPTIONAL MATCH (p)<-[:AUTHORED]-(a:Author)
-        OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
-        OPTIONAL MATCH (p)-[:HAS_IMAGE]->(i:Image)
-        RETURN p,
-               collect(DISTINCT a.name) as authors,
-               collect(DISTINCT k.name) as keywords,
-               collect(DISTINCT i) as images
-        """
-        with self.get_session() as session:
-            result = session.run(query, id=paper_id)
-            record = result.single()
-            if record:
-                paper = record["p"]
-                return {
-                    "id": paper["id"],
-                    "title": paper["title"],
-                    "abstract": paper["abstract"],
-                    "year": paper["year"],
-                    "url": paper["url"],
-                    "full_text": paper.get("full_text"),
-                    "authors": record["authors"],
-                    "keywords": record["keywords"],
-                    "images": [dict(img) for img in record["images"]]
-                }
-        return None
-
-    @contextmanager
-    def get_session(self) -> Generator[Session, None, None]:
+                logger.error(f"Error fetching papers by ids {missing}: {e}")
+                fetched = {}
+            await self._cache_set(fetched)
+            papers.update(fetched)
+        # Keep the caller's order
+        return {pid: papers[pid] for pid in paper_ids if pid in papers}
+
+    async def get_paper_summary_by_ids(self, paper_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve id, title, year, authors and abstract of several papers, keyed by paper ID"""
+        if not paper_ids:
+            return {}
+        try:
+            async with self.get_session() as session:
+                return await session.execute_read(self._get_paper_summaries_tx, paper_ids)
+        except Exception as e:
+            logger.error(f"Error fetching paper summaries by ids {paper_ids}: {e}")
+            return {}
+
+    async def _get_paper_summaries_tx(
+        self,
+        tx: AsyncManagedTransaction,
+        paper_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Transaction to fetch projected paper fields"""
+        result = await tx.run(_CYPHER_GET_PAPER_SUMMARIES_BY_IDS, ids=list(paper_ids))
+        papers = {record["id"]: record.data() async for record in result}
+        # Keep the caller's order
+        return {pid: papers[pid] for pid in paper_ids if pid in papers}
+
+    @staticmethod
+    def _cache_key(paper_id: str) -> str:
+        return f"paper:{paper_id}"
+
+    async def _cache_get(self, paper_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the cached papers among paper_ids; cache errors count as misses"""
+        if not self.cache:
+            return {}
+        try:
+            values = await self.cache.mget([self._cache_key(pid) for pid in paper_ids])
+        except Exception as e:
+            logger.warning(f"Paper cache read failed: {e}")
+            return {}
+        # msgpack keeps chunk_embeddings as bytes, which JSON encoders reject
+        return {
+            pid: msgpack.unpackb(value)
+            for pid, value in zip(paper_ids, values)
+            if value is not None
+        }
+
+    async def _cache_set(self, papers: Dict[str, Dict[str, Any]]):
+        """Cache papers with the configured TTL"""
+        if not self.cache or not papers:
+            return
+        try:
+            async with self.cache.pipeline(transaction=False) as pipe:
+                for pid, paper in papers.items():
+                    pipe.set(self._cache_key(pid), msgpack.packb(paper), ex=self.cache_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Paper cache write failed: {e}")
+
+    async def _cache_invalidate(self, paper_ids: List[str]):
+        """Drop cached copies of papers that were just written"""
+        if not self.cache or not paper_ids:
+            return
+        try:
+            await self.cache.delete(*[self._cache_key(pid) for pid in paper_ids])
+        except Exception as e:
+            logger.warning(f"Paper cache invalidation failed: {e}")
+
+    async def _get_papers_by_ids_tx(
+        self,
+        tx: AsyncManagedTransaction,
+        paper_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Transaction to fetch papers with their authors, keywords and images"""
+        result = await tx.run(_CYPHER_GET_PAPERS_BY_IDS, ids=list(paper_ids))
+        papers = {record["id"]: self._record_to_paper(record) async for record in result}
+        # Keep the caller's order
+        return {pid: papers[pid] for pid in paper_ids if pid in papers}
+
+    @staticmethod
+    def _record_to_paper(record) -> Dict[str, Any]:
+        """Convert a paper record with collected relationships into a dict"""
+        paper = record["p"]
+        return {
+            "id": paper["id"],
+            "title": paper["title"],
+            "abstract": paper["abstract"],
+            "year": paper["year"],
+            "url": paper["url"],
+            "full_text": paper.get("full_text"),
+            "chunk_embeddings": paper.get("chunk_embeddings"),
+            "authors": record["authors"],
+            "keywords": record["keywords"],
+            "images": [dict(img) for img in record["images"]]
+        }
+
+    @asynccontextmanager
+    async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
         """Session context manager"""
+        if self._closing:
+            raise RuntimeError("Neo4j handler is closing")
         if not self.driver:
-            self._connect()
-        session = self.driver.session()
+            self._create_driver()
+
+        self._in_flight += 1
+        self._drained.clear()
         try:
-            yield session
+            session = self.driver.session()
+            try:
+                yield session
+            finally:
+                await session.close()
         finally:
-            session.close()
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._drained.set()
 
     async def close(self):
-        """Close database connection asynchronously"""
-        if self.driver:
-            await self._run_in_executor(self.driver.close)
-            self.driver = None
\ No newline at end of file
+        """Close database connection once in-flight sessions finish"""
+        async with self._close_lock:
+            self._closing = True
+            await self._drained.wait()
+            if self.driver:
+                await self.driver.close()
+                self.driver = None
+            if self.cache:
+                await self.cache.aclose()
+                self.cache = None
\ No newline at end of file
@@ -0,0 +1,15 @@
+# export_onnx.py
+import sys
+from optimum.onnxruntime import ORTModelForCausalLM
+from transformers import AutoTokenizer
+
+def export_onnx(output_dir: str = "onnx/gpt2"):
+    """Export GPT-2 with KV cache to ONNX for QAAgent"""
+    model = ORTModelForCausalLM.from_pretrained("gpt2", export=True, use_cache=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained("gpt2").save_pretrained(output_dir)
+    print(f"Exported GPT-2 to {output_dir}")
+    print(f"Set QA_ONNX_MODEL_DIR={output_dir} to serve it through TensorRT/ONNX Runtime")
+
+if __name__ == "__main__":
+    export_onnx(*sys.argv[1:2])
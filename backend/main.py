@@ -1,57 +1,145 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from models.schemas import (
+    Paper,
     PaperRequest,
     QuestionRequest,
     ReviewRequest,
     SearchRequest,
     FutureWorkRequest,
     ImprovementPlanRequest,
-    GenerateReviewRequest
+    GenerateReviewRequest,
+    WarmupRequest
 )
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from agents.search_agent import SearchAgent
 from agents.qa_agent import QAAgent
 from agents.future_works_agent import FutureWorksAgent
 from database.neo4j_handler import Neo4jHandler
-from services.pdf_processing import PDFProcessingService
+from config import get_settings
+from services.llm_service import LLMService
+from services.completion_client import CompletionClient
 import logging
 from pydantic import BaseModel
 import asyncio
+import json
+import torch
+from typing import Any, AsyncIterator, Dict, List
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI()
+# orjson encodes the large search and review payloads faster than the stdlib
+app = FastAPI(default_response_class=ORJSONResponse)
+# Compress responses for clients that accept gzip; small bodies are not worth it
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+settings = get_settings()
 
 # Initialize database handler
 try:
     db_handler = Neo4jHandler(
         uri="bolt://localhost:7687",
         user="neo4j",
-        password="Hardik18"
+        password="Hardik18",
+        redis_url=settings.REDIS_URL,
+        cache_ttl=settings.PAPER_CACHE_TTL
     )
-    logger.info("Connected to Neo4j database successfully.")
+    logger.info("Neo4j driver created.")
 except Exception as e:
     logger.error(f"Failed to initialize database: {e}")
     raise
 
+def _quantization_config(mode: str):
+    """bitsandbytes config for the OPT weights; only CUDA kernels exist"""
+    if not mode or not torch.cuda.is_available():
+        return None
+    if mode == "int8":
+        return BitsAndBytesConfig(load_in_8bit=True)
+    if mode == "int4":
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.float16
+        )
+    raise ValueError(f"Unsupported LLM_QUANTIZATION: {mode}")
+
+
 # Initialize LLM
+llm_service = None
+completion_client = None
+tokenizer = None
+model = None
 try:
-    tokenizer = AutoTokenizer.from_pretrained("facebook/opt-1.3b")
-    model = AutoModelForCausalLM.from_pretrained("facebook/opt-1.3b")
+    if settings.LLM_SERVICE_MODEL:
+        # One engine serves both agents instead of a model copy per agent
+        llm_service = LLMService(model=settings.LLM_SERVICE_MODEL)
+    elif settings.FUTURE_WORKS_API_URL:
+        # Generation runs in a separate server with continuous batching
+        completion_client = CompletionClient(
+            settings.FUTURE_WORKS_API_URL,
+            settings.FUTURE_WORKS_API_MODEL
+        )
+    else:
+        tokenizer = AutoTokenizer.from_pretrained("facebook/opt-1.3b")
+        quantization_config = _quantization_config(settings.LLM_QUANTIZATION)
+        model = AutoModelForCausalLM.from_pretrained(
+            "facebook/opt-1.3b",
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            quantization_config=quantization_config,
+            # Quantized weights are placed on the GPU at load time
+            device_map="auto" if quantization_config else None
+        )
     logger.info("LLM loaded successfully.")
 except Exception as e:
     logger.error(f"Failed to load LLM: {e}")
     raise
 
 # Initialize agents
-search_agent = SearchAgent(db_handler)
-qa_agent = QAAgent()
-future_works_agent = FutureWorksAgent(model=model, tokenizer=tokenizer)
-pdf_service = PDFProcessingService()
+search_agent = SearchAgent(db_handler, pdf_cache_dir=settings.PDF_CACHE_DIR)
+qa_agent = QAAgent(
+    onnx_model_dir=settings.QA_ONNX_MODEL_DIR,
+    max_inflight=settings.QA_INFLIGHT,
+    assistant_model=settings.QA_ASSISTANT_MODEL,
+    llm_service=llm_service
+)
+future_works_agent = FutureWorksAgent(
+    model=model,
+    tokenizer=tokenizer,
+    llm_service=llm_service,
+    completion_client=completion_client
+)
+# Share the search agent's processor so /search hits the same PDF cache
+pdf_service = search_agent.pdf_processor
+
+
+@app.on_event("startup")
+async def startup():
+    """Verify the database connection"""
+    await db_handler.connect()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close shared HTTP sessions and the database driver"""
+    await pdf_service.close()
+    if completion_client:
+        await completion_client.close()
+    await db_handler.close()
+
+
+async def _sse(events: AsyncIterator[Dict[str, Any]], name: str) -> AsyncIterator[str]:
+    """Encode events as server-sent events, reporting failures as a final error event"""
+    try:
+        async for event in events:
+            yield f"data: {json.dumps(event)}\n\n"
+    except Exception as e:
+        logger.error(f"{name} stream error: {e}")
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
 
 @app.post("/search")
@@ -60,47 +148,25 @@ async def search_papers(request: SearchRequest):
     Endpoint to search for papers based on a topic.
     """
     try:
+        # The agent attaches PDF content and stores the papers in one transaction
         papers = await search_agent.search_papers(request.topic)
         if not papers:
             return {"status": "success", "papers": [], "message": "No papers found"}
-        
-        # Process PDFs for each paper
-        processed_papers = []
-        for paper in papers:
-            try:
-                # Get PDF content
-                pdf_content = await pdf_service.process_pdf_url(paper.url)
-                if pdf_content:
-                    paper.full_text = pdf_content.get("text", "")
-                    paper.images = pdf_content.get("images", [])
-                
-                processed_papers.append({
-                    "id": paper.id,
-                    "title": paper.title,
-                    "authors": paper.authors,
-                    "abstract": paper.abstract,
-                    "year": paper.year,
-                    "url": paper.url,
-                    "has_full_text": bool(paper.full_text),
-                    "has_images": bool(paper.images)
-                })
-                
-                # Store processed paper in the database
-                await search_agent._store_paper_safe(paper)
-                
-            except Exception as e:
-                logger.warning(f"Error processing PDF for paper {paper.id}: {e}")
-                processed_papers.append({
-                    "id": paper.id,
-                    "title": paper.title,
-                    "authors": paper.authors,
-                    "abstract": paper.abstract,
-                    "year": paper.year,
-                    "url": paper.url,
-                    "has_full_text": False,
-                    "has_images": False
-                })
-                
+
+        processed_papers = [
+            {
+                "id": paper.id,
+                "title": paper.title,
+                "authors": paper.authors,
+                "abstract": paper.abstract,
+                "year": paper.year,
+                "url": paper.url,
+                "has_full_text": paper.has_full_text,
+                "has_images": paper.has_images
+            }
+            for paper in papers
+        ]
+
         return {
             "status": "success",
             "papers": processed_papers,
@@ -115,6 +181,19 @@ async def search_papers(request: SearchRequest):
         )
 
 
+async def _load_papers(paper_ids: List[str]) -> List[Paper]:
+    """Load stored papers by ID, in the given order"""
+    found = await db_handler.get_papers_by_ids(paper_ids)
+    return [
+        Paper(
+            **p,
+            has_full_text=bool(p.get("full_text")),
+            has_images=bool(p.get("images"))
+        )
+        for p in found.values()
+    ]
+
+
 @app.post("/answer")
 async def answer_question(request: QuestionRequest):
     """
@@ -122,14 +201,14 @@ async def answer_question(request: QuestionRequest):
     """
     try:
         # Validate request data
-        if not request.paper or not request.question:
+        if not (request.paper or request.paper_ids) or not request.question:
             raise HTTPException(
                 status_code=422,
                 detail="Both paper_ids and question are required"
             )
 
-        # Extract papers from the request
-        papers = request.paper  # Assuming 'paper' is a list of paper dictionaries
+        # Prefer papers sent inline, otherwise load them from the store
+        papers = request.paper or await _load_papers(request.paper_ids)
 
         # Check if papers are provided
         if not papers:
@@ -138,6 +217,12 @@ async def answer_question(request: QuestionRequest):
                 detail="No papers provided for answering the question"
             )
         
+        if request.stream:
+            return StreamingResponse(
+                _sse(qa_agent.stream_answer(papers, request.question), "Answer"),
+                media_type="text/event-stream"
+            )
+
         # Get answer using both paper content and images
         answer = await qa_agent.answer_question(papers, request.question)
         
@@ -157,18 +242,51 @@ async def answer_question(request: QuestionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _warm_papers(paper_ids: List[str]):
+    """Fill whichever paper caches are cold for the given IDs"""
+    try:
+        # Search already cached the chunks of its results; they are only cold
+        # after a restart or once evicted from the LRU
+        cold_ids = qa_agent.text_processor.uncached_ids(paper_ids)
+        # Without Redis, loading papers only helps the chunk cache
+        to_load = paper_ids if db_handler.cache else cold_ids
+        if not to_load:
+            return
+
+        papers = await _load_papers(to_load)
+        cold = set(cold_ids)
+        warmed = await asyncio.to_thread(
+            qa_agent.text_processor.warm_chunks, [p for p in papers if p.id in cold]
+        )
+        logger.info(f"Warmed {len(papers)} papers, {warmed} chunk embeddings")
+    except Exception as e:
+        logger.error(f"Warmup error: {e}")
+
+
+@app.post("/warmup")
+async def warmup(request: WarmupRequest, background_tasks: BackgroundTasks):
+    """
+    Endpoint to prefetch selected papers so later questions hit warm caches.
+    """
+    try:
+        # Runs after the response is sent, so the caller never waits on it
+        background_tasks.add_task(_warm_papers, request.paper_ids)
+        return {"paper_count": len(request.paper_ids)}
+
+    except Exception as e:
+        logger.error(f"Warmup error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/future_work")
 async def future_work(request: FutureWorkRequest):
     """
     Endpoint to generate future work ideas based on selected papers.
     """
     try:
-        # Retrieve full paper details from the database
-        papers = []
-        for paper_id in request.paper_ids:
-            paper = await asyncio.to_thread(db_handler.get_paper_by_id, paper_id)
-            if paper:
-                papers.append(paper)
+        # Prompts only use title, year and abstract, so skip full text and images
+        found = await db_handler.get_paper_summary_by_ids(request.paper_ids)
+        papers = list(found.values())
         
         if not papers:
             raise HTTPException(
@@ -194,12 +312,9 @@ async def improvement_plan(request: ImprovementPlanRequest):
     Endpoint to create an improvement plan based on selected papers.
     """
     try:
-        # Retrieve full paper details from the database
-        papers = []
-        for paper_id in request.paper_ids:
-            paper = await asyncio.to_thread(db_handler.get_paper_by_id, paper_id)
-            if paper:
-                papers.append(paper)
+        # Prompts only use title, year and abstract, so skip full text and images
+        found = await db_handler.get_paper_summary_by_ids(request.paper_ids)
+        papers = list(found.values())
         
         if not papers:
             raise HTTPException(
@@ -226,14 +341,14 @@ async def review_papers(request: ReviewRequest):
     """
     try:
         # Validate request data
-        if not request.paper:
+        if not (request.paper or request.paper_ids):
             raise HTTPException(
                 status_code=422,
                 detail="paper_ids are required for review"
             )
 
-        # Retrieve full paper details from the database
-        papers = request.paper  # Assuming 'paper' is a list of paper dictionaries
+        # Prefer papers sent inline, otherwise retrieve them from the database
+        papers = request.paper or await _load_papers(request.paper_ids)
 
         if not papers:
             raise HTTPException(
@@ -241,6 +356,16 @@ async def review_papers(request: ReviewRequest):
                 detail="No valid papers found for the provided paper_ids"
             )
 
+        if request.stream:
+            events = (
+                {"text": text}
+                async for text in future_works_agent.stream_improvement_plan(papers)
+            )
+            return StreamingResponse(
+                _sse(events, "Review"),
+                media_type="text/event-stream"
+            )
+
         # Proceed with generating the review
         review_data = await future_works_agent.create_improvement_plan(papers)
 
@@ -1,7 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict
 
+# Request bodies are read-only once validated; unknown client fields are dropped
+_REQUEST_CONFIG = ConfigDict(extra='ignore', frozen=True)
+
 class Paper(BaseModel):
+    # Frozen: build updated copies with model_copy(update=...) instead of mutating
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     id: str
     title: str
     authors: List[str]
@@ -12,27 +18,54 @@ class Paper(BaseModel):
     has_images: bool
     full_text: Optional[str] = None
     images: Optional[List[Dict]] = None
+    # float16 paragraph embeddings, packed by TextProcessingService
+    chunk_embeddings: Optional[bytes] = Field(default=None, exclude=True)
 
 class PaperRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     topic: str
     year_range: Optional[int] = 5
 
 class QuestionRequest(BaseModel):
-    paper: List[Paper]
+    model_config = _REQUEST_CONFIG
+
+    # Either full papers or just their IDs, which the backend loads itself
+    paper: List[Paper] = []
+    paper_ids: List[str] = []
     question: str
+    stream: bool = False
 
 class ReviewRequest(BaseModel):
-    paper: List[Paper]
+    model_config = _REQUEST_CONFIG
+
+    # Either full papers or just their IDs, which the backend loads itself
+    paper: List[Paper] = []
+    paper_ids: List[str] = []
+    stream: bool = False
 
 class SearchRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     topic: str
     max_results: Optional[int] = 10
     
 class FutureWorkRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     paper_ids: List[str]
 
 class ImprovementPlanRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     paper_ids: List[str]
 
 class GenerateReviewRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
+    paper_ids: List[str]
+
+class WarmupRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     paper_ids: List[str]
\ No newline at end of file
@@ -0,0 +1,55 @@
+# services/completion_client.py
+import json
+import logging
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+class CompletionClient:
+    """Client for an OpenAI-compatible completions server such as a vLLM sidecar"""
+
+    def __init__(self, base_url: str, model: str):
+        self.base_url = base_url.rstrip("/")
+        # OpenAI-compatible routes live under /v1, e.g. http://host:8000/v1/completions
+        if not self.base_url.endswith("/v1"):
+            self.base_url += "/v1"
+        self.model = model
+        # Created on first use so it binds to the running event loop
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it if needed"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def close(self):
+        """Close the HTTP session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def complete(self, prompt: str, **params: Any) -> str:
+        """Return the completion text for a prompt"""
+        payload = {"model": self.model, "prompt": prompt, **params}
+        async with self._get_session().post(f"{self.base_url}/completions", json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
+        return data["choices"][0]["text"]
+
+    async def stream(self, prompt: str, **params: Any) -> AsyncIterator[str]:
+        """Stream completion text for a prompt as it is generated"""
+        payload = {"model": self.model, "prompt": prompt, "stream": True, **params}
+        async with self._get_session().post(f"{self.base_url}/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.decode().strip()
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["text"]
+                if text:
+                    yield text
@@ -1,8 +1,10 @@
 # services/image_processing.py
 from typing import List
+import io
 import easyocr
 from PIL import Image
 import numpy as np
+import torch
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -10,7 +12,9 @@ logger = logging.getLogger(__name__)
 
 class ImageProcessingService:
     def __init__(self):
-        self.reader = easyocr.Reader(['en'])
+        # quantize only takes effect on CPU, where it loads INT8 weights
+        self.gpu = torch.cuda.is_available()
+        self.reader = easyocr.Reader(['en'], gpu=self.gpu, quantize=True)
 
     def extract_image_text(self, image: Image.Image) -> str:
         """Extract text from image using OCR"""
@@ -29,6 +33,38 @@ class ImageProcessingService:
             logger.error(f"Error extracting text from image: {e}")
             return ""
 
+    def extract_image_texts(self, images: List[Image.Image]) -> List[str]:
+        """Extract text from several images, batching recognition on GPU"""
+        if not images:
+            return []
+        if not self.gpu:
+            return [self.extract_image_text(image) for image in images]
+
+        try:
+            # Batched recognition needs equal sizes, so resize to the largest image
+            arrays = [np.array(image.convert("RGB")) for image in images]
+            height = max(a.shape[0] for a in arrays)
+            width = max(a.shape[1] for a in arrays)
+            batch = self.reader.readtext_batched(arrays, n_width=width, n_height=height)
+            return [' '.join([result[1] for result in results]).strip() for results in batch]
+
+        except Exception as e:
+            logger.error(f"Error extracting text from images: {e}")
+            return [self.extract_image_text(image) for image in images]
+
+    def extract_texts_from_bytes(self, images: List[bytes]) -> List[str]:
+        """Decode raw image bytes and OCR them in one batch; undecodable images yield "" """
+        decoded = []
+        for data in images:
+            try:
+                decoded.append(Image.open(io.BytesIO(data)))
+            except Exception as e:
+                logger.error(f"Error decoding image: {e}")
+                decoded.append(None)
+
+        texts = iter(self.extract_image_texts([img for img in decoded if img is not None]))
+        return [next(texts) if img is not None else "" for img in decoded]
+
 # Create instance for import
 image_processor = ImageProcessingService()
 extract_image_text = image_processor.extract_image_text
\ No newline at end of file
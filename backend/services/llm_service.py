@@ -0,0 +1,71 @@
+# services/llm_service.py
+import asyncio
+import logging
+import uuid
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class LLMService:
+    """Single vLLM engine shared by all agents for continuous batching"""
+
+    def __init__(self, model: str = "gpt2", dtype: str = "float16", max_num_seqs: int = 16):
+        # Imported here so the backend still starts without vLLM installed
+        from vllm import AsyncEngineArgs, AsyncLLMEngine
+
+        self.model = model
+        self.engine = AsyncLLMEngine.from_engine_args(
+            AsyncEngineArgs(model=model, dtype=dtype, max_num_seqs=max_num_seqs)
+        )
+        logger.info(f"LLM service started for {model}")
+
+    async def generate(self, prompt: Any, **sampling: Any) -> AsyncIterator[Any]:
+        """Stream cumulative request outputs for a text or token-id prompt"""
+        from vllm import SamplingParams
+
+        request_id = uuid.uuid4().hex
+        async for output in self.engine.generate(prompt, SamplingParams(**sampling), request_id):
+            yield output
+
+    async def stream_text(self, prompt: Any, **sampling: Any) -> AsyncIterator[str]:
+        """Stream only the newly generated text of each step"""
+        sent = 0
+        async for output in self.generate(prompt, **sampling):
+            text = output.outputs[0].text
+            if len(text) > sent:
+                yield text[sent:]
+                sent = len(text)
+
+    async def complete(self, prompt: Any, **sampling: Any) -> Any:
+        """Return the final request output for a prompt"""
+        final = None
+        async for output in self.generate(prompt, **sampling):
+            final = output
+        return final
+
+
+async def stream_generation(
+    run: Callable[[], Any],
+    streamer: Any,
+    executor: Optional[Executor] = None
+) -> AsyncIterator[str]:
+    """Run a blocking generate() with a TextIteratorStreamer and yield its text as it arrives"""
+    loop = asyncio.get_running_loop()
+
+    def _run():
+        try:
+            return run()
+        finally:
+            # Unblock the reader even if generation fails before it ends the stream
+            streamer.end()
+
+    future = loop.run_in_executor(executor, _run)
+    while True:
+        # The streamer blocks on a queue, so wait for it off the event loop
+        text = await loop.run_in_executor(None, next, streamer, None)
+        if text is None:
+            break
+        if text:
+            yield text
+    await future
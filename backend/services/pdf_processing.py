@@ -1,27 +1,76 @@
 # backend/services/pdf_processing.py
 import fitz  # PyMuPDF
-import requests
-import io
-import base64
+import aiohttp
+import diskcache
+import hashlib
+import os
+import tempfile
+import asyncio
 from typing import Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 class PDFProcessingService:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, cache_dir: Optional[str] = None):
+        # Created on first use so it binds to the running event loop
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Extractions keyed by URL hash; arxiv PDF URLs are stable per version
+        self._cache = (
+            diskcache.Cache(cache_dir, eviction_policy="least-recently-used")
+            if cache_dir else None
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it if needed"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def close(self):
+        """Close the HTTP session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
         
     async def process_pdf_url(self, url: str) -> Optional[Dict]:
+        """Return processed PDF content from the cache, downloading it on a miss"""
+        if self._cache is None:
+            return await self._download_and_process(url)
+
+        key = hashlib.sha1(url.encode()).hexdigest()
+        cached = await asyncio.to_thread(self._cache.get, key)
+        if cached is not None:
+            return cached
+
+        pdf_content = await self._download_and_process(url)
+        if pdf_content:
+            await asyncio.to_thread(self._cache.set, key, pdf_content)
+        return pdf_content
+
+    async def _download_and_process(self, url: str) -> Optional[Dict]:
         """Download and process PDF from URL"""
+        fd, path = tempfile.mkstemp(suffix=".pdf")
         try:
-            # Download PDF
-            response = self.session.get(url)
-            response.raise_for_status()
-            
-            # Load PDF
-            pdf_stream = io.BytesIO(response.content)
-            doc = fitz.open(stream=pdf_stream, filetype="pdf")
+            # Stream the PDF to disk so it is never fully buffered in memory
+            with os.fdopen(fd, "wb") as f:
+                async with self._get_session().get(url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        f.write(chunk)
+
+            # fitz parsing is CPU-bound, so keep it off the event loop
+            return await asyncio.to_thread(self._extract_pdf_content, path, url)
+        except Exception as e:
+            logger.error(f"Error downloading PDF from {url}: {e}")
+            return None
+        finally:
+            os.remove(path)
+
+    def _extract_pdf_content(self, path: str, url: str) -> Optional[Dict]:
+        """Synchronous PDF text and image extraction"""
+        try:
+            # Opening by filename lets fitz read pages from disk on demand
+            doc = fitz.open(path)
             
             text_content = []
             images = []
@@ -35,13 +84,13 @@ class PDFProcessingService:
                 for img_index, img in enumerate(page.get_images()):
                     xref = img[0]
                     base_img = doc.extract_image(xref)
-                    image_data = base64.b64encode(base_img["image"]).decode()
                     
+                    # Raw bytes; no endpoint returns image data, so nothing needs base64
                     images.append({
                         "page": page_num + 1,
                         "index": img_index + 1,
                         "type": base_img["ext"],
-                        "data": image_data
+                        "data": base_img["image"]
                     })
             
             return {
@@ -1,43 +1,233 @@
 # services/text_processing.py
-from typing import List
+from typing import Dict, List, Optional, Union
+from collections import OrderedDict
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
+import torch
+from models.schemas import Paper
 import numpy as np
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Chunk embeddings are kept in float16 to halve memory and storage size
+EMBEDDING_DTYPE = np.float16
 
 class TextProcessingService:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, max_cached_papers: int = 256):
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+        if device == "cuda":
+            self.model.half()
+        # Per-instance cache so the model is not kept alive by a class-level cache
+        self.encode_query = lru_cache(maxsize=1024)(self._encode_query)
+        self._chunk_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # The LRU is used from worker threads; an eviction between another thread's
+        # insert and move_to_end would otherwise raise KeyError
+        self._chunk_lock = threading.Lock()
+        self._max_cached_papers = max_cached_papers
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encode a query; cached results are shared, so make them read-only"""
+        embedding = self.encode(query)
+        embedding.setflags(write=False)
+        return embedding
+
+    def encode(self, texts, batch_size: int = 32):
+        """Encode to unit-length embeddings, so dot products are cosine similarities"""
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+    @staticmethod
+    def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first, without a full sort"""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=int)
+        top = np.argpartition(scores, -k)[-k:]
+        return top[np.argsort(scores[top])[::-1]]
+
+    @staticmethod
+    def split_chunks(full_text: str) -> List[str]:
+        """Split text into non-empty paragraph chunks"""
+        return [chunk.strip() for chunk in full_text.split('\n\n') if chunk.strip()]
+
+    def encode_chunks_cached(
+        self,
+        paper_id: str,
+        chunks: List[str],
+        stored: Optional[bytes] = None
+    ) -> np.ndarray:
+        """Return chunk embeddings for a paper, encoding them only on a cache miss"""
+        embeddings = self._lookup_chunks(paper_id, len(chunks), stored)
+        if embeddings is None:
+            embeddings = self.encode(chunks).astype(EMBEDDING_DTYPE)
+        self._remember_chunks(paper_id, embeddings)
+        return embeddings
 
-    def extract_relevant_text(self, full_text: str, query: str, max_chunks: int = 3) -> str:
+    def _lookup_chunks(
+        self,
+        paper_id: str,
+        count: int,
+        stored: Optional[bytes] = None
+    ) -> Optional[np.ndarray]:
+        """Return cached or stored chunk embeddings, or None if they are missing or stale"""
+        with self._chunk_lock:
+            embeddings = self._chunk_cache.get(paper_id)
+        if embeddings is None and stored:
+            embeddings = self.deserialize_embeddings(stored)
+        # A different chunk count means the paper's text changed since encoding
+        if embeddings is None or embeddings.shape[0] != count:
+            return None
+        return embeddings
+
+    def _remember_chunks(self, paper_id: str, embeddings: np.ndarray):
+        """Add chunk embeddings to the LRU cache"""
+        with self._chunk_lock:
+            self._chunk_cache[paper_id] = embeddings
+            self._chunk_cache.move_to_end(paper_id)
+            if len(self._chunk_cache) > self._max_cached_papers:
+                self._chunk_cache.popitem(last=False)
+
+    def serialize_embeddings(self, embeddings: np.ndarray) -> bytes:
+        """Pack embeddings into bytes for storage as a node property"""
+        return embeddings.astype(EMBEDDING_DTYPE).tobytes()
+
+    def deserialize_embeddings(self, data: bytes) -> np.ndarray:
+        """Unpack embeddings stored by serialize_embeddings"""
+        dim = self.model.get_sentence_embedding_dimension()
+        return np.frombuffer(data, dtype=EMBEDDING_DTYPE).reshape(-1, dim)
+
+    def extract_relevant_text(
+        self,
+        full_text: str,
+        query: str,
+        max_chunks: int = 3,
+        paper_id: Optional[str] = None,
+        stored_embeddings: Optional[bytes] = None
+    ) -> str:
         """Extract most relevant text chunks based on query"""
         # Split text into chunks
-        chunks = [chunk.strip() for chunk in full_text.split('\n\n') if chunk.strip()]
+        chunks = self.split_chunks(full_text)
         
         if not chunks:
             return ""
 
         try:
             # Get embeddings
-            query_embedding = self.model.encode(query)
-            chunk_embeddings = self.model.encode(chunks)
-
-            # Calculate similarities
-            similarities = np.dot(chunk_embeddings, query_embedding)
-            
-            # Get top chunks
-            top_indices = np.argsort(similarities)[-max_chunks:]
-            relevant_chunks = [chunks[i] for i in top_indices]
-            
-            return " ".join(relevant_chunks)
+            query_embedding = self.encode_query(query)
+            if paper_id:
+                chunk_embeddings = self.encode_chunks_cached(paper_id, chunks, stored_embeddings)
+            else:
+                chunk_embeddings = self.encode(chunks)
+
+            return self._select_chunks(chunks, chunk_embeddings, query_embedding, max_chunks)
 
         except Exception as e:
-            print(f"Error extracting relevant text: {e}")
+            logger.error(f"Error extracting relevant text: {e}")
             return ""
-    def rank_contexts(self, contexts: List[str], query: str) -> List[str]:
-        # Example implementation for ranking
-        embeddings = self.model.encode(contexts)
-        query_embedding = self.model.encode(query)
+
+    def extract_relevant_text_multi(
+        self,
+        papers: List[Paper],
+        query: str,
+        max_chunks: int = 3
+    ) -> List[str]:
+        """Extract relevant text from several papers, encoding all uncached chunks in one batch"""
+        paper_chunks = [self.split_chunks(p.full_text or p.abstract or "") for p in papers]
+
+        try:
+            embeddings = self._encode_chunks_multi(papers, paper_chunks)
+            query_embedding = self.encode_query(query)
+            texts = []
+            for paper, chunks, chunk_embeddings in zip(papers, paper_chunks, embeddings):
+                if not chunks:
+                    texts.append("")
+                    continue
+                self._remember_chunks(paper.id, chunk_embeddings)
+                texts.append(
+                    self._select_chunks(chunks, chunk_embeddings, query_embedding, max_chunks)
+                )
+            return texts
+
+        except Exception as e:
+            logger.error(f"Error extracting relevant text: {e}")
+            return [""] * len(papers)
+
+    def uncached_ids(self, paper_ids: List[str]) -> List[str]:
+        """Return the paper IDs whose chunk embeddings are not in the LRU cache"""
+        with self._chunk_lock:
+            return [pid for pid in paper_ids if pid not in self._chunk_cache]
+
+    def warm_chunks(self, papers: List[Paper]) -> int:
+        """Load chunk embeddings into the LRU cache, encoding only papers with none stored"""
+        paper_chunks = [self.split_chunks(p.full_text or p.abstract or "") for p in papers]
+        try:
+            embeddings = self._encode_chunks_multi(papers, paper_chunks)
+        except Exception as e:
+            logger.error(f"Error warming chunk embeddings: {e}")
+            return 0
+        warmed = 0
+        for paper, chunk_embeddings in zip(papers, embeddings):
+            if chunk_embeddings is not None:
+                self._remember_chunks(paper.id, chunk_embeddings)
+                warmed += 1
+        return warmed
+
+    def _encode_chunks_multi(
+        self,
+        papers: List[Paper],
+        paper_chunks: List[List[str]]
+    ) -> List[Optional[np.ndarray]]:
+        """Look up chunk embeddings for several papers, encoding the misses in one batch"""
+        embeddings: List[Optional[np.ndarray]] = [
+            self._lookup_chunks(p.id, len(chunks), p.chunk_embeddings) if chunks else None
+            for p, chunks in zip(papers, paper_chunks)
+        ]
+        pending = [i for i, chunks in enumerate(paper_chunks) if chunks and embeddings[i] is None]
+        if pending:
+            flat = [chunk for i in pending for chunk in paper_chunks[i]]
+            encoded = self.encode(flat, batch_size=64).astype(EMBEDDING_DTYPE)
+            offsets = np.cumsum([len(paper_chunks[i]) for i in pending])[:-1]
+            for i, paper_embeddings in zip(pending, np.split(encoded, offsets)):
+                embeddings[i] = paper_embeddings
+        return embeddings
+
+    def _select_chunks(
+        self,
+        chunks: List[str],
+        chunk_embeddings: np.ndarray,
+        query_embedding: np.ndarray,
+        max_chunks: int
+    ) -> str:
+        """Join the chunks most similar to the query"""
+        # Calculate similarities
+        similarities = np.dot(chunk_embeddings.astype(np.float32), query_embedding)
+        
+        # Get top chunks, least relevant first as before
+        top_indices = self.top_k_indices(similarities, max_chunks)[::-1]
+        relevant_chunks = [chunks[i] for i in top_indices]
+        
+        return " ".join(relevant_chunks)
+    def rank_contexts(
+        self,
+        contexts: List[Union[str, Dict]],
+        query: str,
+        top_k: Optional[int] = None
+    ) -> List[Union[str, Dict]]:
+        """Rank contexts (strings or dicts with a "text" key) by similarity to query"""
+        if not contexts:
+            return []
+        texts = [c["text"] if isinstance(c, dict) else c for c in contexts]
+        embeddings = self.encode(texts)
+        query_embedding = self.encode_query(query)
         scores = np.dot(embeddings, query_embedding)
-        ranked_indices = np.argsort(scores)[::-1]
+        ranked_indices = self.top_k_indices(scores, top_k or len(contexts))
         return [contexts[i] for i in ranked_indices]
 
 # Create instance for import
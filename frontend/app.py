@@ -1,12 +1,68 @@
 import streamlit as st
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
 import re
 import logging
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 API_URL = "http://localhost:8000"
 
+# (connect, read) seconds per endpoint; read covers the gap between streamed chunks
+TIMEOUTS = {
+    "/search": (5, 120),
+    "/answer": (5, 120),
+    "/review": (5, 300),
+    "/warmup": (5, 30),
+}
+# Compress buffered responses; keep streams uncompressed so tokens are not held back
+GZIP_HEADERS = {"Accept-Encoding": "gzip"}
+STREAM_HEADERS = {"Accept-Encoding": "identity"}
+# Rows sent to the browser per page of search results
+PAGE_SIZE = 50
+
+# Intent keywords in priority order; the first intent with a match wins
+_INTENT_KEYWORDS = {
+    "search": ["search", "show", "papers"],
+    "qa": ["explain", "what", "how", "why", "describe"],
+    "review": ["review", "summarize", "summary"],
+    "future_works": ["future", "improvements", "suggestions"],
+}
+_KEYWORD_INTENT = {kw: intent for intent, kws in _INTENT_KEYWORDS.items() for kw in kws}
+# Substring matches as before ("research" routes to search); the lookahead finds
+# overlapping keywords too, so every keyword present in the message is reported
+_INTENT_RE = re.compile(r"(?=(" + "|".join(_KEYWORD_INTENT) + "))")
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    """Keep-alive session shared across reruns instead of a new connection per request"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+    return session
+
+@st.cache_resource
+def background_pool() -> ThreadPoolExecutor:
+    """Worker threads for fire-and-forget backend calls"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def _post_warmup(session: requests.Session, paper_ids: List[str]):
+    # Runs on a pool thread without a script context, so it gets the session passed in
+    try:
+        session.post(
+            f"{API_URL}/warmup", json={"paper_ids": paper_ids}, timeout=TIMEOUTS["/warmup"]
+        )
+    except Exception as e:
+        logger.error(f"Warmup request failed: {e}")
+
+def prefetch_papers(paper_ids: List[str]):
+    """Let the backend warm its caches while the user reads the results"""
+    background_pool().submit(_post_warmup, http_session(), paper_ids)
+
 st.title("Academic Research Assistant")
 
 logger = logging.getLogger(__name__)
@@ -16,24 +72,58 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "papers" not in st.session_state:
     st.session_state.papers = []
-if "papers_df" not in st.session_state:
-    st.session_state.papers_df = None
+if "papers_by_id" not in st.session_state:
+    st.session_state.papers_by_id = {}
+if "paper_ids" not in st.session_state:
+    st.session_state.paper_ids = []
 if 'selected_papers' not in st.session_state:
     st.session_state.selected_papers = []
 
 def detect_intent(message: str) -> str:
     """Detect user intent from message"""
-    message = message.lower()
-    if any(x in message for x in ["search", "show", "papers"]):
-        return "search"
-    elif any(x in message for x in ["explain", "what", "how", "why", "describe"]):
-        return "qa"
-    elif any(x in message for x in ["review", "summarize", "summary"]):
-        return "review"
-    elif any(x in message for x in ["future", "improvements", "suggestions"]):
-        return "future_works"
+    found = {_KEYWORD_INTENT[kw] for kw in _INTENT_RE.findall(message.lower())}
+    for intent in _INTENT_KEYWORDS:
+        if intent in found:
+            return intent
     return "qa"  # default to QA
 
+@st.cache_data(ttl=600, show_spinner=False)
+def search_papers(topic: str) -> Dict:
+    """Search the backend; repeated topics are served from cache for 10 minutes"""
+    response = http_session().post(
+        f"{API_URL}/search",
+        json={"topic": topic},
+        headers=GZIP_HEADERS,
+        timeout=TIMEOUTS["/search"]
+    )
+    # Raising keeps failed searches out of the cache
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+@st.cache_data
+def papers_dataframe(paper_ids: Tuple[str, ...], _papers: List[Dict]) -> "pd.DataFrame":
+    """Build the search results table; cached on the paper IDs"""
+    # Imported on first use so chat-only sessions start without pandas
+    import pandas as pd
+
+    return pd.DataFrame([{
+        'Title': p['title'],
+        'Year': p['year'],
+        'Authors': ', '.join(p['authors']),
+        'Abstract': p['abstract'][:200] + '...'
+    } for p in _papers])
+
+@st.cache_data
+def selected_papers_dataframe(paper_ids: Tuple[str, ...], _papers: List[Dict]) -> "pd.DataFrame":
+    """Build the selected papers table; cached on the paper IDs"""
+    import pandas as pd
+
+    return pd.DataFrame([{
+        'Title': p['title'],
+        'Authors': ', '.join(p['authors']),
+        'Year': p['year'],
+    } for p in _papers])
+
 # def format_review(review: Dict) -> tuple:
 #     """Format review as DataFrames"""
 #     # Main findings DataFrame
@@ -58,7 +148,48 @@ def detect_intent(message: str) -> str:
 
 #     return findings_df, metrics_df
 
-def process_message(user_message: str) -> str:
+def stream_events(response: requests.Response) -> Iterator[Dict]:
+    """Decode server-sent events from a streaming backend response"""
+    # Closing the response hands its connection back to the session pool
+    with response:
+        # orjson parses the raw bytes, so lines are not decoded first
+        for line in response.iter_lines():
+            if line and line.startswith(b"data: "):
+                yield orjson.loads(line[len(b"data: "):])
+
+def stream_answer(response: requests.Response) -> Iterator[str]:
+    """Yield the answer as it streams in, followed by its confidence and sources"""
+    yield "### Answer\n"
+    try:
+        for event in stream_events(response):
+            if "error" in event:
+                yield f"\n\n❌ Error: {event['error']}"
+            elif "text" in event:
+                yield event["text"]
+            elif "confidence" in event:
+                final_text = f"\n\n**Confidence:** {event['confidence']:.2%}\n"
+                if event.get("sources"):
+                    final_text += "\n### Sources\n"
+                    for source in event["sources"]:
+                        final_text += f"- **{source['title']}** ({source['year']})\n"
+                        final_text += f"  Excerpt: {source['excerpt']}\n"
+                yield final_text
+    except Exception as e:
+        yield f"\n\n❌ Error: {str(e)}"
+
+def stream_review(response: requests.Response) -> Iterator[str]:
+    """Yield the review as it streams in"""
+    yield "### Research Review\n\n"
+    try:
+        for event in stream_events(response):
+            if "error" in event:
+                yield f"\n\n❌ Error: {event['error']}"
+            elif "text" in event:
+                yield event["text"]
+    except Exception as e:
+        yield f"\n\n❌ Error: {str(e)}"
+
+def process_message(user_message: str) -> Union[str, Iterator[str]]:
     """Process user message and return assistant's response"""
     intent = detect_intent(user_message)
 
@@ -67,75 +198,74 @@ def process_message(user_message: str) -> str:
             topic_match = re.search(r"(?:about|related to|papers on|find)\s+(.+?)(?:\s+in|\?|$)", user_message)
             topic = topic_match.group(1) if topic_match else user_message
 
-            response = requests.post(f"{API_URL}/search", json={"topic": topic})
-            if response.status_code == 200:
-                papers = response.json()["papers"]
-                count = response.json()["count"]
-                st.session_state.papers = papers
-                st.session_state.selected_papers = []
-
-                # Convert to DataFrame
-                df = pd.DataFrame([{
-                    'Title': p['title'],
-                    'Year': p['year'],
-                    'Authors': ', '.join(p['authors']),
-                    'Abstract': p['abstract'][:200] + '...'
-                } for p in papers])
-
-                st.session_state.papers_df = df
-
-                return f"🔍 Found {count} papers on '{topic}'"
-            else:
+            try:
+                search_data = search_papers(topic)
+            except requests.HTTPError:
                 return "❌ Error fetching papers"
 
+            papers = search_data["papers"]
+            count = search_data.get("count", len(papers))
+            st.session_state.papers = papers
+            # Index the results once so reruns look papers up by ID instead of scanning
+            st.session_state.papers_by_id = {p["id"]: p for p in papers}
+            st.session_state.paper_ids = [p["id"] for p in papers]
+            st.session_state.selected_papers = []
+            prefetch_papers(st.session_state.paper_ids)
+
+            return f"🔍 Found {count} papers on '{topic}'"
+
         elif intent == "qa":
             if not st.session_state.selected_papers:
                 return "⚠️ Please select papers to use for Q&A!"
 
-            response = requests.post(
+            response = http_session().post(
                 f"{API_URL}/answer",
                 json={
-                    "paper": st.session_state.selected_papers,
-                    "question": user_message
-                }
+                    # The backend loads the papers itself, so only send their IDs
+                    "paper_ids": [p["id"] for p in st.session_state.selected_papers],
+                    "question": user_message,
+                    "stream": True
+                },
+                headers=STREAM_HEADERS,
+                stream=True,
+                timeout=TIMEOUTS["/answer"]
             )
 
             if response.status_code == 200:
-                answer_data = response.json()
-                if answer_data and 'answer' in answer_data:
-                    # Build the response string
-                    response_text = f"### Answer\n{answer_data['answer']}\n\n"
-                    response_text += f"**Confidence:** {answer_data.get('confidence', 0):.2%}\n\n"
-
-                    if answer_data.get('sources'):
-                        response_text += "### Sources\n"
-                        for source in answer_data['sources']:
-                            response_text += f"- **{source['title']}** ({source['year']})\n"
-                            response_text += f"  Excerpt: {source['excerpt']}\n"
-
-                    return response_text
-                else:
-                    return "❌ No answer received"
+                # Render tokens as they arrive instead of waiting for the full answer
+                return stream_answer(response)
             else:
+                # Unread streamed responses keep their connection out of the pool
+                response.close()
                 return f"❌ Error: Server returned status {response.status_code}"
 
         elif intent in ["review", "future_works"]:
             if not st.session_state.selected_papers:
                 return "⚠️ Please select papers first!"
 
-            response = requests.post(
+            response = http_session().post(
                 f"{API_URL}/review",
-                json={"paper": st.session_state.selected_papers}
+                json={
+                    "paper_ids": [p["id"] for p in st.session_state.selected_papers],
+                    "stream": True
+                },
+                headers=STREAM_HEADERS,
+                stream=True,
+                timeout=TIMEOUTS["/review"]
             )
             if response.status_code == 200:
-                review_data = response.json()
-
-                review_text = f"### Research Review\n\n{review_data['review']}\n\n"
-
-                return review_text
+                return stream_review(response)
             else:
+                response.close()
                 return f"❌ Error fetching review"
 
+    except requests.Timeout as e:
+        path = e.request.path_url if e.request is not None else ""
+        if path in TIMEOUTS:
+            return f"❌ Error: {path} timed out after {TIMEOUTS[path][1]}s"
+        return "❌ Error: The backend timed out"
+    except requests.ConnectionError:
+        return "❌ Error: Could not reach the backend"
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
@@ -153,42 +283,50 @@ if prompt := st.chat_input("Ask me about research papers..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Process the message and get the response
-    response = process_message(prompt)
+    # Process the message and display the response, streaming it if possible
+    with st.chat_message("assistant"):
+        response = process_message(prompt)
+        if isinstance(response, str):
+            st.markdown(response)
+        else:
+            response = st.write_stream(response)
 
     # Append assistant's response
     st.session_state.messages.append({"role": "assistant", "content": response})
-    with st.chat_message("assistant"):
-        st.markdown(response)
 
 # Display search results and multiselect in the sidebar
 if st.session_state.papers:
     with st.sidebar:
         st.write("### Search Results")
-        st.dataframe(st.session_state.papers_df, use_container_width=True)
+        # Built once per result set; reruns reuse the cached frame
+        papers_df = papers_dataframe(
+            tuple(st.session_state.paper_ids),
+            st.session_state.papers
+        )
+        # Only the current page is serialized to the browser on each rerun
+        page_count = max(1, -(-len(papers_df) // PAGE_SIZE))
+        page = st.number_input("Page", 1, page_count, 1) if page_count > 1 else 1
+        start = (page - 1) * PAGE_SIZE
+        st.dataframe(papers_df.iloc[start:start + PAGE_SIZE], use_container_width=True)
 
-        # Create a dictionary mapping paper IDs to titles
-        paper_dict = {p["id"]: p["title"] for p in st.session_state.papers}
+        papers_by_id = st.session_state.papers_by_id
 
         # Display the multiselect widget
         selected_paper_ids = st.multiselect(
             "Select Papers to Use:",
-            options=list(paper_dict.keys()),
-            format_func=lambda x: paper_dict[x],
+            options=st.session_state.paper_ids,
+            format_func=lambda x: papers_by_id[x]["title"],
             default=[p["id"] for p in st.session_state.selected_papers]
         )
 
         # Update selected papers in session state
-        st.session_state.selected_papers = [
-            p for p in st.session_state.papers if p["id"] in selected_paper_ids
-        ]
+        st.session_state.selected_papers = [papers_by_id[pid] for pid in selected_paper_ids]
 
         # Optionally, display the selected papers
         if st.session_state.selected_papers:
             st.write("### Selected Papers for Q&A")
-            selected_df = pd.DataFrame([{
-                'Title': p['title'],
-                'Authors': ', '.join(p['authors']),
-                'Year': p['year'],
-            } for p in st.session_state.selected_papers])
+            selected_df = selected_papers_dataframe(
+                tuple(p['id'] for p in st.session_state.selected_papers),
+                st.session_state.selected_papers
+            )
             st.dataframe(selected_df, use_container_width=True)
\ No newline at end of file